@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from tqdm import tqdm
+from .processing.behav_container import BehavCollector
+from .processing.behav_extractor import BehavExtractor
+from .processing.export_profile import FPS_SOURCE, FPS_WRITE, ExportProfile
+from .processing.export_stats import ExportStats
+from .processing.behav_session import SESSION_EXT, load_session, read_session
+from .processing.mosaic import MosaicLayout
+
+
+# Headless batch export of the behavior epochs (no PyQt):
+#   collect_behavior-export SESSION [SESSION ...] -o OUTPUT_ROOT [-j WORKERS] [--video-dir DIR] [--mosaic]
+# SESSION is a directory of behav_*.json files or a session file, exported into OUTPUT_ROOT/<session name>
+# The counters of every session and their total (see ExportStats) are printed to stdout in JSON
+
+
+def session_name(path: str):
+    name = os.path.basename(os.path.normpath(path))
+    return name[:-len(SESSION_EXT)] if name.endswith(SESSION_EXT) else name
+
+
+def load_export_session(path: str, video_dir: str=None):
+    # BehavCollector of the session, with the video paths stored in the annotations
+    bcollector = BehavCollector.new_session()
+    if path.endswith(SESSION_EXT):
+        load_session(path, bcollector)
+        video_path, _ = read_session(path)
+    else:
+        BehavCollector.load(path, bcollector)
+        video_path = bcollector.behav_set[0].video_path if bcollector.num > 0 else []
+
+    video_path = [p for p in (video_path or []) if p is not None]
+    if video_dir is not None:
+        # videos moved to another place (e.g. a server mount)
+        video_path = [os.path.join(video_dir, os.path.basename(p)) for p in video_path]
+    if len(video_path) == 0:
+        raise ValueError(f"No video path found in {path}")
+    bcollector.update_video_path(video_path)
+    return bcollector
+
+
+def export_session(path: str, output_root: str, video_dir: str=None, skip_existing: bool=True,
+                   mosaic: MosaicLayout=None, profile: ExportProfile=None):
+    # export one session (runs in a worker process), returns the failed epochs and the counters
+    bcollector = load_export_session(path, video_dir)
+    for p in bcollector.video_path:
+        if not os.path.exists(p):
+            raise FileNotFoundError(f"Video {p} not found")
+
+    path_dir = os.path.join(output_root, session_name(path))
+    os.makedirs(path_dir, exist_ok=True)
+    extractor = BehavExtractor(bcollector, profile)
+    extractor.extract_epochs(
+        path_dir, tqdm_fn=partial(tqdm, disable=True), sweep=True, skip_existing=skip_existing, resume=skip_existing,
+        mosaic=mosaic
+    )
+    return extractor.manifest.failures(), extractor.stats
+
+
+def export_sessions(paths, output_root: str, num_workers: int=None, video_dir: str=None,
+                    skip_existing: bool=True, mosaic: MosaicLayout=None, profile: ExportProfile=None,
+                    tqdm_fn=None):
+    # export every session, one process per session
+    # returns {path: error message} of the failed sessions, {path: {file name: error}} of the failed epochs
+    # and {path: ExportStats} of the exported sessions
+    if tqdm_fn is None:
+        tqdm_fn = tqdm
+
+    failed, failed_epochs, stats = {}, {}, {}
+    bar = tqdm_fn(total=len(paths), desc="Exporting sessions")
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        futures = {
+            pool.submit(export_session, path, output_root, video_dir, skip_existing, mosaic, profile): path
+            for path in paths
+        }
+        for future in as_completed(futures):
+            try:
+                epochs, stats[futures[future]] = future.result()
+                if len(epochs) > 0:
+                    failed_epochs[futures[future]] = epochs
+            except Exception as e:
+                failed[futures[future]] = str(e)
+                warnings.warn(f"Failed to export {futures[future]}: {e}")
+            bar.update()
+    bar.close()
+    return failed, failed_epochs, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="collect_behavior-export",
+        description="Export the behavior epochs (clips and snapshots) of annotated sessions without the GUI."
+    )
+    parser.add_argument("sessions", nargs="+", help="directories of behav_*.json files or session (.npz) files")
+    parser.add_argument("-o", "--output", required=True, help="output root, one sub-directory per session")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="sessions exported in parallel (default: all cores)")
+    parser.add_argument("--video-dir", default=None, help="look up the videos by file name in this directory")
+    parser.add_argument(
+        "--overwrite", action="store_true",
+        help="extract again the clips/snapshots that exist (by default, only the epochs missing or failed "
+             "in OUTPUT_ROOT/<session name>/export_manifest.json are extracted)"
+    )
+    parser.add_argument("--mosaic", action="store_true", help="tile all the videos into one clip/snapshot per epoch")
+    parser.add_argument("--mosaic-rows", type=int, default=None, help="rows of the mosaic (default: square grid)")
+    parser.add_argument("--mosaic-cols", type=int, default=None, help="columns of the mosaic")
+    parser.add_argument("--tile-scale", type=float, default=0.5, help="downscale of every mosaic tile")
+    parser.add_argument("--scale", type=float, default=1., help="resize factor of the clips and snapshots")
+    parser.add_argument(
+        "--roi", type=int, nargs=5, action="append", default=[], metavar=("VIDEO", "X", "Y", "W", "H"),
+        help="crop of a video (index in the session), can be repeated"
+    )
+    parser.add_argument("--fps", default=str(FPS_WRITE), help=f"output fps, or '{FPS_SOURCE}' (default: {FPS_WRITE})")
+    parser.add_argument("--decimate", type=int, default=1, help="keep one frame out of DECIMATE")
+    parser.add_argument("--codec", default="XVID", help="fourcc of the clips (default: XVID)")
+    args = parser.parse_args(argv)
+    profile = ExportProfile(
+        scale=args.scale,
+        roi={r[0]: tuple(r[1:]) for r in args.roi},
+        fps=args.fps if args.fps == FPS_SOURCE else float(args.fps),
+        decimate=args.decimate,
+        codec=args.codec
+    )
+    mosaic = MosaicLayout(args.mosaic_rows, args.mosaic_cols, args.tile_scale) if args.mosaic else None
+
+    os.makedirs(args.output, exist_ok=True)
+    t0 = time.perf_counter()
+    failed, failed_epochs, stats = export_sessions(
+        args.sessions, args.output, num_workers=args.workers,
+        video_dir=args.video_dir, skip_existing=not args.overwrite, mosaic=mosaic, profile=profile
+    )
+    total = ExportStats()
+    for s in stats.values():
+        total.merge(s)
+    total.wall_seconds = time.perf_counter() - t0
+    report = {"sessions": {path: s.report() for path, s in stats.items()}, "total": total.report()}
+    print(json.dumps(report, indent=1))
+    for path, error in failed.items():
+        print(f"FAILED {path}: {error}", file=sys.stderr)
+    for path, epochs in failed_epochs.items():
+        for file_name, error in epochs.items():
+            print(f"FAILED {path} {file_name}: {error}", file=sys.stderr)
+    return 1 if len(failed) + len(failed_epochs) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -44,6 +44,9 @@ from .config_menu import MenuBuilder
 
 from ..processing.behav_container import BehavCollector, BEHAV_TYPES, EVENT, STATE
 from ..processing.behav_extractor import BehavExtractor
+from ..processing.behav_journal import BehavJournal
+from ..processing.mosaic import MosaicLayout
+import os
 import re
 
 
@@ -106,6 +109,7 @@ class BehavPanel(QWidget):
         self.is_modifying = False
         self.current_selection = -1
         self.duration_ms = 0
+        self.journal = BehavJournal.acquire() # one journal directory per running instance
         # self._reset_keep()
         
     def _init_ui(self):
@@ -165,6 +169,9 @@ class BehavPanel(QWidget):
         menubar.save_header_requested.connect(self.export_behavior_header)
         menubar.save_behav_requested.connect(self.export_behavior)
         menubar.export_epochs_requested.connect(self.export_epochs)
+        menubar.export_mosaic_requested.connect(self.export_mosaic_epochs)
+        menubar.export_snapshots_requested.connect(self.export_snapshot_archive)
+        menubar.export_highlights_requested.connect(self.export_highlights)
         
     def connect_controller(self, video_control_obj: Controller):
         self.video_controller = video_control_obj
@@ -180,6 +187,7 @@ class BehavPanel(QWidget):
                 raise ValueError("Please load the video first")
             else:
                 self.bcollector = BehavCollector()
+                self._attach_journal()
         
         name = self.text_name.text()
         type = self.comb_type.currentText()
@@ -296,11 +304,56 @@ class BehavPanel(QWidget):
                 raise ValueError("No behavior data found in the selected directory.")
                 
             self._add_behav_set()
-            for n in range(self.bcollector.num):
-                for time_ms in self.bcollector.get_value(n, "time_ms"):
-                    self._add_behav_time(n, time_ms, add_to_collector=False)    
+            self._add_loaded_behav_times()
+            self._attach_journal(saved=True)
+    
+    @error2messagebox(to_warn=True)
+    def recover_journal(self):
+        if not self.journal.has_unsaved():
+            return
+        
+        reply = QMessageBox.question(
+            self,
+            "Recover behavior",
+            "Unsaved behaviors from the last session were found. Do you want to recover them?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.Yes
+        )
+        if reply == QMessageBox.No:
+            self.journal.clear()
+            return
+        
+        # recovered apart from the collector shared by the GUI, which only takes the behaviors once the videos are open
+        bcollector = self.journal.recover(BehavCollector.new_session())
+        for video_path in bcollector.video_path:
+            if video_path is not None and os.path.exists(video_path):
+                self.video_controller.open_video(video_path)
+        if self.video_controller.num_video == 0:
+            # moved away, so that the next session does not compact over it
+            backup_dir = self.journal.set_aside()
+            raise ValueError("Videos of the recovered behaviors are not found. The journal is kept in %s"%(backup_dir))
+        
+        self.bcollector = BehavCollector()
+        self.bcollector.behav_set = bcollector.behav_set
+        self.bcollector.video_path = bcollector.video_path
+        self._add_behav_set()
+        self._add_loaded_behav_times()
+        self._attach_journal()
+    
+    def close_journal(self):
+        self.journal.clear()
+        self.journal.release()
+    
+    def _attach_journal(self, saved=False):
+        self.bcollector.update_video_path(self.video_controller.current_video_path)
+        self.bcollector.attach_journal(self.journal, saved=saved)
+    
+    def _add_loaded_behav_times(self):
+        for n in range(self.bcollector.num):
+            for time_ms in self.bcollector.get_value(n, "time_ms"):
+                self._add_behav_time(n, time_ms, add_to_collector=False)    
 
-            self._compare_item_number()
+        self._compare_item_number()
     
     def _compare_item_number(self):
         # double-check if the number of items in behav_viewer matches the bcollector
@@ -319,6 +372,7 @@ class BehavPanel(QWidget):
             #     raise ValueError("Behavior collector already loaded. Please create a new instance.")
             self.bcollector = BehavCollector.load_header(file_path)
             self._add_behav_set()
+            self._attach_journal()
     
     @error2messagebox(to_warn=True)
     def export_behavior_header(self):
@@ -329,21 +383,68 @@ class BehavPanel(QWidget):
     
     @error2messagebox(to_warn=True)
     def export_behavior(self):
-        path_dir = QFileDialog.getExistingDirectory(self, "Select behavior directory")
+        # saving again into the directory of the last save/load only rewrites modified behaviors
+        save_dir = self.bcollector.save_dir if self.bcollector is not None else None
+        path_dir = QFileDialog.getExistingDirectory(self, "Select behavior directory", save_dir or "")
         if path_dir:
             self.bcollector.update_video_path(self.video_controller.current_video_path)
             if self.bcollector.save(path_dir):
+                self.journal.mark_saved()
                 self.signal_saved.emit()
                 QMessageBox.information(self, "Success", "Behavior data saved successfully.")
     
     @error2messagebox(to_warn=True)
-    def export_epochs(self):
+    def export_epochs(self, mosaic: MosaicLayout=None):
+        path_dir = QFileDialog.getExistingDirectory(self, "Select export directory")
+        if path_dir:
+            self.bcollector.update_video_path(self.video_controller.current_video_path)
+            extractor = BehavExtractor(self.bcollector)
+            if extractor.extract_epochs(path_dir, tqdm_fn=tqdm_qt, num_workers=None, mosaic=mosaic):
+                failed = extractor.manifest.failures()
+                if len(failed) > 0:
+                    lines = [f"{f}: {e}" for f, e in list(failed.items())[:10]]
+                    QMessageBox.warning(
+                        self, "Export incomplete",
+                        f"{len(failed)} epochs were not exported (export again to retry them):\n" + "\n".join(lines)
+                    )
+                else:
+                    QMessageBox.information(
+                        self, "Success", f"Behavior epochs exported successfully.\n{extractor.stats.summary()}"
+                    )
+        
+    def export_mosaic_epochs(self):
+        # all the open videos tiled into one clip/snapshot per epoch
+        self.export_epochs(mosaic=MosaicLayout())
+        
+    @error2messagebox(to_warn=True)
+    def export_snapshot_archive(self):
+        # every Event snapshot in one archive, with contact sheets next to it
+        file_name, _ = QFileDialog.getSaveFileName(
+            self, "Export event snapshots", "snapshots.zip", "Zip archive (*.zip);;Tar archive (*.tar)"
+        )
+        if file_name:
+            if not file_name.endswith((".zip", ".tar")):
+                file_name += ".zip"
+            sheet_dir = os.path.splitext(file_name)[0] + "_contact_sheets"
+            os.makedirs(sheet_dir, exist_ok=True)
+            self.bcollector.update_video_path(self.video_controller.current_video_path)
+            extractor = BehavExtractor(self.bcollector)
+            if extractor.export_snapshot_archive(file_name, tqdm_fn=tqdm_qt, contact_sheet_dir=sheet_dir):
+                QMessageBox.information(
+                    self, "Success", f"Event snapshots exported to {file_name}.\n{extractor.stats.summary()}"
+                )
+    
+    @error2messagebox(to_warn=True)
+    def export_highlights(self):
+        # one reel per State behavior and video, with all its bouts
         path_dir = QFileDialog.getExistingDirectory(self, "Select export directory")
         if path_dir:
             self.bcollector.update_video_path(self.video_controller.current_video_path)
             extractor = BehavExtractor(self.bcollector)
-            if extractor.extract_epochs(path_dir, tqdm_fn=tqdm_qt):
-                QMessageBox.information(self, "Success", "Behavior epochs exported successfully.")
+            if extractor.export_highlights(path_dir, tqdm_fn=tqdm_qt, num_workers=None):
+                QMessageBox.information(
+                    self, "Success", f"Highlight reels exported successfully.\n{extractor.stats.summary()}"
+                )
         
     def _add_behav_set(self):
         existing_keys = [b.behav_key for b in self.behav_rows]
@@ -443,8 +544,9 @@ class BehavPanel(QWidget):
         
     def _delete_behav(self, time_ms):
         # TODO: tracking both bcollector and behavior viewer is dangerous.
-        self.bcollector.delete_behav_time(time_ms)
-        self.behav_viewer.delete_item(time_ms)
+        for key_id, t in self.bcollector.delete_behav_time(time_ms):
+            _time_ms = t if isinstance(t, list) else [t, t+1]
+            self.behav_viewer.delete_item(key_id, _time_ms[0], _time_ms[1])
         
     def _update_duration(self, duration_ms):
         self.duration_ms = duration_ms
@@ -55,7 +55,7 @@ class BehavViewer(QGraphicsView):
         self.setSceneRect(0, 0, self.width, self.height)
         self.fitInView(QRectF(0, 0, self.max_show, self.height), Qt.IgnoreAspectRatio)
         
-        self.lines = []
+        self.lines = defaultdict(list) # (key_id, time_ms_start, time_ms_end) -> lines
         self.num_items = defaultdict(int)
         self._init_ticks()
         self._init_line()
@@ -114,8 +114,9 @@ class BehavViewer(QGraphicsView):
  
     def resizeEvent(self, event):
         super().resizeEvent(event)
-        for line in self.lines:
-            line.update_position(scene_width=self.width, scene_height=self.height, duration_ms=self.duration_ms)
+        for lines in self.lines.values():
+            for line in lines:
+                line.update_position(scene_width=self.width, scene_height=self.height, duration_ms=self.duration_ms)
         
     def clear_scene(self):
         self.scene.clear()
@@ -125,17 +126,20 @@ class BehavViewer(QGraphicsView):
         line.set_rewind_function(self.update_controller)
         
         self.scene.addItem(line)
-        self.lines.append(line)
+        self.lines[(key_id, time_ms_start, time_ms_end)].append(line)
         line.update_position(scene_width=self.width, scene_height=self.height, duration_ms=self.duration_ms)
         self.num_items[key_id] += 1
         
-    def delete_item(self, time_ms):
-        for line in self.lines:
-            if line.scene() == self.scene:
-                if line.time_ms_start <= time_ms <= line.time_ms_end:
-                    key_id = line.key_id
-                    self.num_items[key_id] -= 1
-                    self.scene.removeItem(line)
+    def delete_item(self, key_id, time_ms_start, time_ms_end):
+        lines = self.lines.get((key_id, time_ms_start, time_ms_end))
+        if not lines:
+            return
+        line = lines.pop()
+        if not lines:
+            del self.lines[(key_id, time_ms_start, time_ms_end)]
+        if line.scene() == self.scene:
+            self.num_items[key_id] -= 1
+            self.scene.removeItem(line)
         
     def update_duration(self, duration_ms):
         self.duration_ms = duration_ms
@@ -11,6 +11,10 @@ class MenuBuilder(QObject):
     save_header_requested   = pyqtSignal()
     save_behav_requested    = pyqtSignal()
     export_epochs_requested = pyqtSignal()
+    export_mosaic_requested = pyqtSignal()
+    export_snapshots_requested = pyqtSignal()
+    export_highlights_requested = pyqtSignal()
+    proxy_toggled = pyqtSignal(bool)
 
     def __init__(self, parent: QMainWindow):
         super().__init__(parent)
@@ -32,6 +36,12 @@ class MenuBuilder(QObject):
         open_eeg_action.triggered.connect(self.load_eeg_requested.emit)
         file_menu.addAction(open_eeg_action)
 
+        # Proxy videos
+        proxy_action = QAction("Use Proxy Videos for Scrubbing", self.parent)
+        proxy_action.setCheckable(True)
+        proxy_action.toggled.connect(self.proxy_toggled.emit)
+        file_menu.addAction(proxy_action)
+
         file_menu.addSeparator()
 
         # Load Header
@@ -64,6 +74,18 @@ class MenuBuilder(QObject):
         export_epochs_action.triggered.connect(self.export_epochs_requested.emit)
         file_menu.addAction(export_epochs_action)
 
+        export_mosaic_action = QAction("Export Behavior Epochs as Mosaic", self.parent)
+        export_mosaic_action.triggered.connect(self.export_mosaic_requested.emit)
+        file_menu.addAction(export_mosaic_action)
+
+        export_snapshots_action = QAction("Export Event Snapshots to Archive", self.parent)
+        export_snapshots_action.triggered.connect(self.export_snapshots_requested.emit)
+        file_menu.addAction(export_snapshots_action)
+
+        export_highlights_action = QAction("Export Behavior Highlight Reels", self.parent)
+        export_highlights_action.triggered.connect(self.export_highlights_requested.emit)
+        file_menu.addAction(export_highlights_action)
+
         # Help menu
         help_menu = self.menubar.addMenu("Help")
         show_help_action = QAction("Show Help", self.parent)
@@ -1,5 +1,5 @@
 from PyQt5.QtWidgets import QHBoxLayout, QVBoxLayout, QWidget, QMainWindow, QMessageBox, QFileDialog
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtCore import Qt, pyqtSignal, QTimer
 from scipy.io import loadmat
 from .video_controller import Controller
 from .behav_panel import BehavPanel, BehavViewer, pyqt_KEY_MAP
@@ -22,8 +22,8 @@ class MainWindow(QMainWindow):
         self._init_menu()
         self._connect_signals()
         
-        self.is_behav_saved = False
         self.eeg_dialog = None
+        QTimer.singleShot(0, self.behav_control.recover_journal)
         
     def _init_ui(self):
         layout = QHBoxLayout()
@@ -51,15 +51,16 @@ class MainWindow(QMainWindow):
     def _connect_signals(self):
         self.behav_control.connect_controller(self.controller)
         self.behav_control.connect_behav_viewer(self.behav_viewer)
-        self.behav_control.signal_saved.connect(self.behav_saved)
         self.behav_viewer.connect_controller(self.controller)
         self.main_window_closed.connect(self.controller.close_all_viewers)
         self.controller.connect_menubar(self.menubar)
         self.behav_control.connect_menubar(self.menubar)
         self.menubar.load_eeg_requested.connect(self.open_eeg)
         
-    def behav_saved(self):
-        self.is_behav_saved = True
+    @property
+    def is_behav_saved(self):
+        bcollector = self.behav_control.bcollector
+        return bcollector is None or not bcollector.is_dirty
         
     def closeEvent(self, event):
         if not self.is_behav_saved:
@@ -75,6 +76,7 @@ class MainWindow(QMainWindow):
                 event.ignore()
                 return
         
+        self.behav_control.close_journal()
         self.main_window_closed.emit()
         return super().closeEvent(event)
 
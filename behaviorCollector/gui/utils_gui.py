@@ -83,14 +83,17 @@ class tqdm_qt(QDialog):
         self.progress_bar = QProgressBar()
         self.progress_bar.setRange(0, self.total)
         self.label_time = QLabel("0:00 / ??:??")
+        self.label_postfix = QLabel("")
+        self.label_postfix.setWordWrap(True)
 
         layout.addWidget(self.label_desc)
         layout.addWidget(self.progress_bar)
         layout.addWidget(self.label_time)
+        layout.addWidget(self.label_postfix)
 
         self.setLayout(layout)
         self.setWindowModality(Qt.ApplicationModal)
-        self.setFixedSize(400, 100)
+        self.setFixedSize(400, 140)
 
         self.elapsed_timer.start()
         self.timer_ui.start(1000)
@@ -106,6 +109,12 @@ class tqdm_qt(QDialog):
         if self.n >= self.total:
             self.close()
 
+    def set_postfix_str(self, s="", refresh=True):
+        # same as tqdm: extra text (e.g., the throughput) under the progress bar
+        self.label_postfix.setText(s)
+        if refresh:
+            QApplication.processEvents()
+
     def update_time_label(self):
         elapsed_ms = self.elapsed_timer.elapsed()
         elapsed_s = elapsed_ms / 1000
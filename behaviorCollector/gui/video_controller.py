@@ -5,15 +5,19 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import Qt, pyqtSignal, QTimer
 import numpy as np
+import warnings
 from functools import partial
+from multiprocessing import get_context
 from .video_viewer import VideoViewerWindow
 from .config_menu import MenuBuilder
+from ..processing.proxy_video import build_proxy, find_proxy
 
 
 FPS_DEFAULT = 30
 PENDING_TIME = 50
 MOVE_LARGE = 10000 # 10 s
 MOVE_SMALL = 5000  # 5s
+PROXY_WORKERS = 2  # proxies transcoded at the same time
 
 
 class Controller(QWidget):
@@ -30,6 +34,8 @@ class Controller(QWidget):
         self._init_timer()
         self.playing_state = False
         self.min_fps = FPS_DEFAULT
+        self.use_proxy = False
+        self.proxy_pool = None
         # self._update_slider_value = True
         
     def _init_ui(self):
@@ -81,6 +87,7 @@ class Controller(QWidget):
         
         self.slider = QSlider(Qt.Horizontal)
         self.slider.sliderMoved.connect(self.seek_slider)
+        self.slider.sliderReleased.connect(self._release_slider)
         self._set_slider_style()
         layout.addWidget(self.slider)
         
@@ -94,21 +101,27 @@ class Controller(QWidget):
         
     def connect_menubar(self, menubar: MenuBuilder):
         menubar.load_video_requested.connect(self.load_video)
+        menubar.proxy_toggled.connect(self.set_use_proxy)
         
     def load_video(self):
         video_path, _ = QFileDialog.getOpenFileName(self, "Open Video File", "", "Video Files (*.mp4 *.avi *.mov)")
         if video_path:
-            viewer = VideoViewerWindow(video_path, len(self.viewers))
-            viewer.show()
+            self.open_video(video_path)
             
-            self.viewers.append(viewer)
-            viewer.closed.connect(self.closed_video)
-            
-            if self.num_video == 1:
-                self._connect_viewer_signals(viewer)
+    def open_video(self, video_path: str):
+        viewer = VideoViewerWindow(video_path, len(self.viewers))
+        viewer.show()
+        
+        self.viewers.append(viewer)
+        viewer.closed.connect(self.closed_video)
+        
+        if self.num_video == 1:
+            self._connect_viewer_signals(viewer)
+        if self.use_proxy:
+            self._request_proxy(viewer)
 
-            if viewer.fps < self.min_fps:
-                self.min_fps = np.ceil(viewer.fps).astype(int)
+        if viewer.fps < self.min_fps:
+            self.min_fps = np.ceil(viewer.fps).astype(int)
                 
     def closed_video(self, vid: int):
         self.viewers[vid] = None
@@ -123,6 +136,44 @@ class Controller(QWidget):
             if viewer is not None:
                 viewer.closed.disconnect(self.closed_video)
                 viewer.close()
+        if self.proxy_pool is not None:
+            self.proxy_pool.terminate() # unfinished proxies are left as temporary files
+            self.proxy_pool = None
+    
+    def set_use_proxy(self, enabled: bool):
+        # scrub and step on the proxies of the videos, built in the background when they are not cached
+        self.use_proxy = enabled
+        for viewer in self.viewers:
+            if viewer is not None:
+                if enabled:
+                    self._request_proxy(viewer)
+                else:
+                    viewer.set_proxy(None)
+    
+    def _request_proxy(self, viewer):
+        proxy_path = find_proxy(viewer.video_path)
+        if proxy_path is not None:
+            viewer.set_proxy(proxy_path)
+            return
+        if self.proxy_pool is None:
+            # spawned, not forked from the GUI process
+            self.proxy_pool = get_context("spawn").Pool(PROXY_WORKERS)
+        self.proxy_pool.apply_async(
+            build_proxy, (viewer.video_path,),
+            callback=partial(self._proxy_done, viewer),
+            error_callback=partial(self._proxy_failed, viewer)
+        )
+    
+    def _proxy_done(self, viewer, proxy_path):
+        # called in a thread of the pool: the signal hands the proxy over to the GUI thread
+        if self.use_proxy:
+            try:
+                viewer.proxy_ready.emit(proxy_path)
+            except RuntimeError:
+                pass # the viewer was closed
+    
+    def _proxy_failed(self, viewer, e):
+        warnings.warn(f"Failed to build the proxy of {viewer.video_path}: {e}")
     
     def _connect_viewer_signals(self, viewer):
         viewer.media_player.durationChanged.connect(self.update_duration)
@@ -139,19 +190,43 @@ class Controller(QWidget):
         self.position_updated.emit(position_ms)
         
     def seek_slider(self, position_ms):
+        # with proxies, the viewers follow the slider at once and the players seek when it is released
+        viewers = [viewer for viewer in self.viewers if viewer is not None]
+        if len(viewers) > 0 and all([viewer.preview_position(position_ms) for viewer in viewers]):
+            self.current_label.setText(f"Time: {position_ms/1e3:.3f} s")
+            return
+        self.seek_timer.start(PENDING_TIME)
+    
+    def _release_slider(self):
         self.seek_timer.start(PENDING_TIME)
         
     def seek_relative(self, delta_ms):
         self.pending_seek_ms += delta_ms
         self.seek_timer.start(PENDING_TIME)
         
-    def _do_seek(self):
+    def step_frames(self, num_frames: int):
+        # move by whole frames of the first video (exact for variable frame rate videos)
+        viewer = next((v for v in self.viewers if v is not None), None)
+        if viewer is None or viewer.frame_index is None:
+            self.seek_relative(num_frames * int(1000/self.min_fps))
+            return
+        target = self.current + self.pending_seek_ms
+        delta_ms = viewer.step_position(target, num_frames) - target
+        if viewer.frame_source is None:
+            self.seek_relative(delta_ms)
+            return
+        # applied at once, not after PENDING_TIME: the viewers show the frames from their cache
+        self.pending_seek_ms += delta_ms
+        self.seek_timer.stop()
+        self._do_seek(step=True)
+        
+    def _do_seek(self, step: bool=False):
         if self.pending_seek_ms != 0:
             new_pos = max(0, self.current + self.pending_seek_ms) # ms
             new_pos = min(new_pos, self.slider.maximum())
             for viewer in self.viewers:
                 if viewer is not None:
-                    viewer.update_position(position_ms=new_pos)
+                    viewer.update_position(position_ms=new_pos, step=step)
             self.pending_seek_ms = 0
             self.slider.setValue(new_pos)
         else:
@@ -212,9 +287,9 @@ class Controller(QWidget):
             if key == Qt.Key_Space:
                 self.toggle_play()
             elif key == Qt.Key_H:
-                self.seek_relative(-int(1000/self.min_fps))
+                self.step_frames(-1)
             elif key == Qt.Key_L:
-                self.seek_relative(int(1000/self.min_fps))
+                self.step_frames(1)
             elif key == Qt.Key_J: # speed down
                 self.update_speed_relative(-0.1)
             elif key == Qt.Key_K: # speed up
@@ -229,7 +304,7 @@ class Controller(QWidget):
         else:
             for viewer in self.viewers:
                 if viewer is not None:
-                    return viewer.media_player.position()
+                    return viewer.position()
         
     @property
     def num_video(self):
@@ -1,18 +1,31 @@
 import cv2
+import numpy as np
+import threading
+import warnings
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QLabel, 
     QGraphicsView, QHBoxLayout, QSpacerItem, QSizePolicy,
-    QGraphicsScene, QToolButton
+    QGraphicsScene, QToolButton, QGraphicsPixmapItem
 )
+from PyQt5.QtGui import QImage, QPixmap
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 from PyQt5.QtMultimediaWidgets import QGraphicsVideoItem
 from PyQt5.QtCore import Qt, QUrl, QTimer, QRectF, QSizeF, QPointF, pyqtSignal
+from ..processing.frame_index import find_frame_index, load_frame_index
+from ..processing.frame_source import FrameSource
+from ..processing.proxy_video import ProxyCapture
+
+
+INSPECT_DELAY_MS = 250 # still for this long on a proxy frame: the frame of the original video replaces it
 
 
 
 class VideoViewerWindow(QMainWindow):
 
     closed = pyqtSignal(int)
+    proxy_ready = pyqtSignal(str)
+    frame_decoded = pyqtSignal(int) # emitted by the prefetch thread of the frame source
+    frame_index_ready = pyqtSignal(object)
     
     def __init__(self, video_path, vid: int):
         super().__init__()
@@ -27,6 +40,7 @@ class VideoViewerWindow(QMainWindow):
     
     def _init_video(self, video_path):
         # read video information
+        self.frame_source = None
         self._load_video_info(video_path) # fps, frame_count
         self.media_player = QMediaPlayer(None, QMediaPlayer.VideoSurface) # load media player
         
@@ -47,6 +61,31 @@ class VideoViewerWindow(QMainWindow):
         self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(video_path)))
         self.media_player.positionChanged.connect(self.update_time_label)
         self.media_player.mediaStatusChanged.connect(self.on_media_status_changed)
+        
+        # while paused, the frames are decoded by the frame source and drawn over the video item
+        self.frame_item = QGraphicsPixmapItem()
+        self.frame_item.setZValue(1)
+        self.frame_item.hide()
+        self.scene.addItem(self.frame_item)
+        self.shown_ms = 0
+        self.pending_ms = None # position whose frame is decoded in the background, drawn when it is ready
+        self.frame_decoded.connect(self._frame_decoded)
+        try:
+            self.frame_source = FrameSource(video_path, self.frame_index, on_ready=self.frame_decoded.emit)
+        except Exception as e:
+            warnings.warn(f"Failed to open the frame source of {video_path}: {e}")
+            self.frame_source = None
+        if self.frame_index is None:
+            # indexed in the background, as every packet of the video is read
+            self.frame_index_ready.connect(self.set_frame_index)
+            threading.Thread(target=self._index_frames, daemon=True).start()
+        
+        # low resolution frames for scrubbing and stepping (see set_proxy)
+        self.proxy_source = None
+        self.inspect_timer = QTimer(self)
+        self.inspect_timer.setSingleShot(True)
+        self.inspect_timer.timeout.connect(self._show_original)
+        self.proxy_ready.connect(self.set_proxy)
     
     def _init_ui(self):        
         layout = QVBoxLayout()
@@ -81,12 +120,54 @@ class VideoViewerWindow(QMainWindow):
         fps = cap.get(cv2.CAP_PROP_FPS)
         self.fps = fps if fps > 1e-3 else 0
         frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.num_frames = frame_count
         self.duration_ms = int(frame_count/self.fps*1e3) if self.fps > 1e-3 else 0
         cap.release()
         
+        # exact frame times (variable frame rate) when they are cached, None falls back to the constant fps
+        # until the video is indexed (see _index_frames)
+        self.frame_index = None
+        try:
+            frame_index = find_frame_index(path)
+        except Exception as e:
+            warnings.warn(f"Failed to read the frame index of {path}: {e}")
+            frame_index = None
+        if frame_index is not None:
+            self.set_frame_index(frame_index)
+    
+    def _index_frames(self):
+        # runs in a thread: the signal hands the index over to the GUI thread
+        try:
+            frame_index = load_frame_index(self.video_path)
+        except Exception as e:
+            warnings.warn(f"Failed to index the frames of {self.video_path}: {e}")
+            return
+        try:
+            self.frame_index_ready.emit(frame_index)
+        except RuntimeError:
+            pass # the viewer was closed
+    
+    def set_frame_index(self, frame_index):
+        self.frame_index = frame_index
+        self.duration_ms = int(np.ceil(frame_index.duration_ms))
+        self.num_frames = len(frame_index)
+        if self.frame_source is not None:
+            self.frame_source.set_frame_index(frame_index)
+        
+    def frame_number(self, position_ms):
+        if self.frame_index is not None:
+            return self.frame_index.frame_at(position_ms)
+        return int(position_ms / 1000 * self.fps)
+    
+    def step_position(self, position_ms, num_frames: int):
+        # position (ms) of the frame num_frames away from the one shown at position_ms
+        if self.frame_index is not None:
+            return int(np.ceil(self.frame_index.step(position_ms, num_frames)))
+        return position_ms + num_frames * int(1000/self.fps) if self.fps > 1e-3 else position_ms
+        
     def update_time_label(self, position_ms):
         seconds = position_ms / 1000
-        frame_number = int(seconds * self.fps)
+        frame_number = self.frame_number(position_ms)
         self.time_label.setText(f"Time: {seconds:.3f} s / {self.duration_ms/1000:.3f} s | Frame: {frame_number}")
 
     def on_media_status_changed(self, status):
@@ -95,10 +176,93 @@ class VideoViewerWindow(QMainWindow):
             self.media_player.pause()
             QTimer.singleShot(100, self._resize)
 
-    def update_position(self, position_ms):
+    def set_proxy(self, proxy_path: str=None):
+        # proxy of the video (see build_proxy), read by frame number: None stops using it
+        if self.proxy_source is not None:
+            self.proxy_source.release()
+            self.proxy_source = None
+        if proxy_path is None:
+            return
+        try:
+            source = FrameSource(proxy_path, cap=ProxyCapture(proxy_path))
+        except Exception as e:
+            warnings.warn(f"Failed to open the proxy of {self.video_path}: {e}")
+            return
+        if source.num_frames != self.num_frames:
+            warnings.warn(f"The proxy of {self.video_path} has {source.num_frames} frames instead of {self.num_frames}")
+            source.release()
+            return
+        self.proxy_source = source
+    
+    def update_position(self, position_ms, step: bool=False):
+        # step: frame step, decoded here when it is not cached (the frames around the cursor are prefetched)
+        if self.media_player.state() != QMediaPlayer.PlayingState:
+            # shown from the cache right away; the media player follows to resume playing from there
+            if self._show_frame(position_ms, preview=True, decode=step):
+                self.media_player.setPosition(position_ms)
+                return
+        self.frame_item.hide()
         self.media_player.setPosition(position_ms)
         QTimer.singleShot(100, self.media_player.pause)
     
+    def preview_position(self, position_ms):
+        # scrubbing: the proxy frame only, the media player is not moved (False without a proxy)
+        if self.proxy_source is None or self.media_player.state() == QMediaPlayer.PlayingState:
+            return False
+        return self._show_frame(position_ms, preview=True)
+    
+    def _show_frame(self, position_ms, preview: bool=False, decode: bool=False):
+        # preview: the proxy frame, unless the frame of the original video is in its cache already;
+        # the original frame replaces it after INSPECT_DELAY_MS
+        # otherwise the frame is taken from the cache, and a frame that is not cached is decoded on this
+        # thread only with decode, else in the background, and drawn when it is ready (returns False)
+        # (frames are taken by number, so position_ms stays in the time base of the original video)
+        frame_number = self.frame_number(position_ms)
+        self.pending_ms = position_ms
+        frame = None
+        if preview and self.proxy_source is not None:
+            frame = self.frame_source.peek(frame_number) if self.frame_source is not None else None
+            if frame is None:
+                frame = self.proxy_source.get(frame_number)
+                self.inspect_timer.start(INSPECT_DELAY_MS)
+        elif self.frame_source is not None:
+            frame = self.frame_source.get(frame_number, wait=decode)
+        if frame is None:
+            return False
+        self._draw_frame(frame, position_ms)
+        return True
+    
+    def _frame_decoded(self, frame_number):
+        # drawn when it is still the frame to show
+        if self.pending_ms is None or self.media_player.state() == QMediaPlayer.PlayingState:
+            return
+        if self.frame_number(self.pending_ms) != frame_number:
+            return
+        frame = self.frame_source.peek(frame_number)
+        if frame is not None:
+            self._draw_frame(frame, self.pending_ms)
+    
+    def _draw_frame(self, frame, position_ms):
+        self.pending_ms = None
+        h, w = frame.shape[:2]
+        image = QImage(frame.data, w, h, frame.strides[0], QImage.Format_RGB888).rgbSwapped()
+        self.frame_item.setPixmap(QPixmap.fromImage(image))
+        video_size = self.video_item.nativeSize()
+        self.frame_item.setScale(video_size.width() / w if not video_size.isEmpty() else 1.) # proxy frames are smaller
+        self.frame_item.show()
+        self.shown_ms = position_ms
+        self.update_time_label(position_ms)
+    
+    def _show_original(self):
+        if self.frame_item.isVisible() and self.media_player.state() != QMediaPlayer.PlayingState:
+            self._show_frame(self.shown_ms)
+    
+    def position(self):
+        # time of the frame on screen
+        if self.frame_item.isVisible():
+            return self.shown_ms
+        return self.media_player.position()
+    
     def resizeEvent(self, event):
         super().resizeEvent(event)
         self._resize()
@@ -111,6 +275,9 @@ class VideoViewerWindow(QMainWindow):
             self.view.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
         
     def play(self):
+        self.inspect_timer.stop()
+        self.pending_ms = None
+        self.frame_item.hide()
         self.media_player.play()
         
     def pause(self):
@@ -138,6 +305,10 @@ class VideoViewerWindow(QMainWindow):
             self.view.scale(zoom_out_factor, zoom_out_factor)
             
     def closeEvent(self, event):
+        self.inspect_timer.stop()
+        if self.frame_source is not None:
+            self.frame_source.release()
+        self.set_proxy(None)
         self.closed.emit(self.vid)
         super().closeEvent(event)
     
@@ -0,0 +1,161 @@
+import numpy as np
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from itertools import combinations
+from typing import List, Tuple
+from tqdm import tqdm
+from .behav_container import BehavCollector
+from .behav_session import SESSION_EXT, load_session
+from .behav_matrix import frame_ranges, rasterize
+
+
+BIN_MS = 100       # bin size of the kappa statistics
+TOLERANCE_MS = 500 # maximum onset difference of a match
+
+
+@dataclass
+class AgreementResult:
+    """
+    Agreement of annotators (paths) on the behaviors they all annotated.
+    pairs[k] = (i, j) indexes paths; cohen_kappa and onset_f1 have shape (pairs, behaviors).
+    fleiss_kappa has shape (behaviors,). Kappa is NaN when it is undefined (no variation at all).
+    """
+    paths: List[str]
+    behav_names: List[str]
+    pairs: List[Tuple[int, int]]
+    cohen_kappa: np.ndarray
+    fleiss_kappa: np.ndarray
+    onset_f1: np.ndarray
+
+
+def load_annotator(path: str):
+    # annotations of one annotator as an independent BehavCollector
+    bcollector = BehavCollector.new_session()
+    if path.endswith(SESSION_EXT):
+        return load_session(path, bcollector)
+    return BehavCollector.load(path, bcollector)
+
+
+def cohen_kappa(a: np.ndarray, b: np.ndarray):
+    # binary labels (bins, behaviors) of two annotators -> kappa per behavior
+    a, b = a.astype(bool), b.astype(bool)
+    po = np.mean(a == b, axis=0)
+    pa, pb = a.mean(axis=0), b.mean(axis=0)
+    pe = pa*pb + (1-pa)*(1-pb)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(pe < 1, (po - pe) / (1 - pe), np.nan)
+
+
+def fleiss_kappa(labels: np.ndarray):
+    # binary labels (annotators, bins, behaviors) -> kappa per behavior
+    m = labels.shape[0]
+    n1 = labels.astype(np.int64).sum(axis=0) # annotators labeling the bin
+    n0 = m - n1
+    p_bin = (n1*(n1-1) + n0*(n0-1)) / (m*(m-1))
+    p_mean = p_bin.mean(axis=0)
+    p1 = n1.mean(axis=0) / m
+    pe = p1**2 + (1-p1)**2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(pe < 1, (p_mean - pe) / (1 - pe), np.nan)
+
+
+def onset_f1(onset_a: np.ndarray, onset_b: np.ndarray, tolerance_ms: int=TOLERANCE_MS):
+    # onsets are matched when they are mutual nearest neighbors within tolerance_ms
+    onset_a, onset_b = np.sort(onset_a), np.sort(onset_b)
+    if len(onset_a) + len(onset_b) == 0:
+        return np.nan
+    if len(onset_a) == 0 or len(onset_b) == 0:
+        return 0.
+
+    def _nearest(x, ref):
+        # index of the nearest value in sorted ref for every x
+        if len(ref) == 1:
+            return np.zeros(len(x), dtype=np.int64)
+        idx = np.clip(np.searchsorted(ref, x), 1, len(ref)-1)
+        use_left = x - ref[idx-1] <= ref[idx] - x
+        return np.where(use_left, idx-1, idx)
+
+    nn_ab = _nearest(onset_a, onset_b)
+    nn_ba = _nearest(onset_b, onset_a)
+    mutual = nn_ba[nn_ab] == np.arange(len(onset_a))
+    matched = mutual & (np.abs(onset_a - onset_b[nn_ab]) <= tolerance_ms)
+    return 2 * np.count_nonzero(matched) / (len(onset_a) + len(onset_b))
+
+
+def compute_agreement(paths: List[str], bin_ms: int=BIN_MS, tolerance_ms: int=TOLERANCE_MS):
+    """
+    Agreement between annotators of the same video(s).
+    paths: behav_*.json directories (or session files) of each annotator
+    """
+    if len(paths) < 2:
+        raise ValueError("At least two annotators are needed")
+    collectors = [load_annotator(p) for p in paths]
+
+    names = [b.name for b in collectors[0].behav_set]
+    for bc in collectors[1:]:
+        other = set(b.name for b in bc.behav_set)
+        names = [n for n in names if n in other]
+
+    # per annotator: bins x behaviors labels, in the order of names
+    fps = 1000 / bin_ms
+    ranges, onsets = [], []
+    for bc in collectors:
+        behavs = {b.name: b for b in bc.behav_set}
+        by_name = dict(zip(behavs, frame_ranges(bc, fps)))
+        ranges.append([by_name[n] for n in names])
+        onsets.append([np.array(behavs[n].time_ms.onsets) for n in names])
+
+    t_end = max([int(b.time_ms.offsets.max()) for bc in collectors for b in bc.behav_set if b.num > 0], default=0)
+    num_bins = int(t_end * fps / 1000) + 1
+    labels = np.stack([rasterize(r, 0, num_bins) for r in ranges])
+
+    pairs = list(combinations(range(len(paths)), 2))
+    kappa = np.array([cohen_kappa(labels[i], labels[j]) for i, j in pairs]).reshape(len(pairs), len(names))
+    f1 = np.array([
+        [onset_f1(onsets[i][k], onsets[j][k], tolerance_ms) for k in range(len(names))]
+        for i, j in pairs
+    ]).reshape(len(pairs), len(names))
+
+    return AgreementResult(
+        paths=list(paths),
+        behav_names=names,
+        pairs=pairs,
+        cohen_kappa=kappa,
+        fleiss_kappa=fleiss_kappa(labels),
+        onset_f1=f1
+    )
+
+
+def compute_cohort_agreement(groups: List[List[str]], bin_ms: int=BIN_MS, tolerance_ms: int=TOLERANCE_MS,
+                             num_workers: int=None, tqdm_fn=None):
+    """
+    compute_agreement of every group of annotators (one process per group).
+    Returns a list of AgreementResult (None for the groups that failed).
+    """
+    if tqdm_fn is None:
+        tqdm_fn = tqdm
+
+    results = [None] * len(groups)
+    bar = tqdm_fn(total=len(groups), desc="Computing agreement")
+    if num_workers == 1:
+        for n, paths in enumerate(groups):
+            try:
+                results[n] = compute_agreement(paths, bin_ms, tolerance_ms)
+            except Exception as e:
+                warnings.warn(f"Failed to compute agreement of {paths}: {e}")
+            bar.update()
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            futures = {
+                pool.submit(compute_agreement, paths, bin_ms, tolerance_ms): n for n, paths in enumerate(groups)
+            }
+            for future in as_completed(futures):
+                n = futures[future]
+                try:
+                    results[n] = future.result()
+                except Exception as e:
+                    warnings.warn(f"Failed to compute agreement of {groups[n]}: {e}")
+                bar.update()
+    bar.close()
+    return results
@@ -0,0 +1,92 @@
+import numpy as np
+from typing import Union
+from .behav_container import BehavCollector, BehavInfo, STATE
+from .time_array import TimeArray
+
+
+# Interval set algebra on State times. Bouts are treated as half-open [onset, offset),
+# and every result is a TimeArray of sorted, non-overlapping bouts.
+
+
+def _as_times(time_ms: Union[TimeArray, BehavInfo]):
+    if isinstance(time_ms, BehavInfo):
+        time_ms = time_ms.time_ms
+    if time_ms.is_event:
+        raise ValueError("Interval operations are only defined for States")
+    return np.asarray(time_ms.onsets, dtype=np.int64), np.asarray(time_ms.offsets, dtype=np.int64)
+
+
+def _merge(onset: np.ndarray, offset: np.ndarray, max_gap_ms: int=0):
+    # merge bouts (sorted by onset) overlapping or separated by less than max_gap_ms
+    if len(onset) == 0:
+        return onset, offset
+    max_offset = np.maximum.accumulate(offset)
+    new_group = np.empty(len(onset), dtype=bool)
+    new_group[0] = True
+    if max_gap_ms > 0:
+        new_group[1:] = onset[1:] - max_offset[:-1] >= max_gap_ms
+    else:
+        new_group[1:] = onset[1:] > max_offset[:-1]
+    starts = np.flatnonzero(new_group)
+    ends = np.append(starts[1:], len(onset)) - 1
+    return onset[starts], max_offset[ends]
+
+
+def normalize(time_ms: Union[TimeArray, BehavInfo]):
+    # overlapping and touching bouts merged
+    onset, offset = _as_times(time_ms)
+    return TimeArray.from_arrays(*_merge(onset, offset), is_event=False)
+
+
+def _combine(a, b, op):
+    # segments between all the endpoints of a and b, kept where op(in_a, in_b) holds
+    a_on, a_off = _merge(*_as_times(a))
+    b_on, b_off = _merge(*_as_times(b))
+    edges = np.unique(np.concatenate((a_on, a_off, b_on, b_off)))
+    if len(edges) < 2:
+        return TimeArray(is_event=False)
+    seg_on, seg_off = edges[:-1], edges[1:]
+
+    def _inside(on, off):
+        if len(on) == 0: # behavior without bouts
+            return np.zeros(len(seg_on), dtype=bool)
+        idx = np.searchsorted(on, seg_on, side="right") - 1
+        return (idx >= 0) & (seg_on < off[np.maximum(idx, 0)])
+
+    keep = op(_inside(a_on, a_off), _inside(b_on, b_off))
+    return TimeArray.from_arrays(*_merge(seg_on[keep], seg_off[keep]), is_event=False)
+
+
+def union(a: Union[TimeArray, BehavInfo], b: Union[TimeArray, BehavInfo]):
+    return _combine(a, b, np.logical_or)
+
+
+def intersection(a: Union[TimeArray, BehavInfo], b: Union[TimeArray, BehavInfo]):
+    return _combine(a, b, np.logical_and)
+
+
+def difference(a: Union[TimeArray, BehavInfo], b: Union[TimeArray, BehavInfo]):
+    # "a but not b"
+    return _combine(a, b, lambda in_a, in_b: in_a & ~in_b)
+
+
+def merge_gaps(time_ms: Union[TimeArray, BehavInfo], max_gap_ms: int):
+    # bouts separated by less than max_gap_ms merged into one
+    onset, offset = _as_times(time_ms)
+    return TimeArray.from_arrays(*_merge(onset, offset, max_gap_ms), is_event=False)
+
+
+def drop_short(time_ms: Union[TimeArray, BehavInfo], min_duration_ms: int):
+    # bouts shorter than min_duration_ms removed
+    onset, offset = _as_times(time_ms)
+    keep = offset - onset >= min_duration_ms
+    return TimeArray.from_arrays(onset[keep], offset[keep], is_event=False)
+
+
+def add_derived_behav(bcollector: BehavCollector, name: str, time_ms: TimeArray,
+                      note: str="", color_code: str="#000000"):
+    # add the result of the operations above as a new State behavior, returns its behavior id
+    bcollector.add_behav(name=name, note=note, type=STATE, color_code=color_code)
+    behav_id = bcollector.num - 1
+    bcollector.set_behav_times(behav_id, time_ms)
+    return behav_id
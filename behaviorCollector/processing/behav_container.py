@@ -1,8 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional, List, Union
 from collections import defaultdict
 import json
 import os
+from .time_array import TimeArray
 
 
 EVENT = "Event"
@@ -19,7 +20,12 @@ class BehavInfo:
     type: str
     color_code: str # HEX color code
     video_path: List = None
-    time_ms: str = None
+    time_ms: TimeArray = None
+    dirty: bool = field(default=True, repr=False, compare=False) # modified since last save/load
+    
+    def __post_init__(self):
+        if not isinstance(self.time_ms, TimeArray):
+            self.time_ms = TimeArray.from_list(self.time_ms, self.type == EVENT)
     
     # def add_video_path(self, video_path: str):
     #     if self.video_path is None:
@@ -30,36 +36,37 @@ class BehavInfo:
     #     self.video_path[video_id] = None
     
     def append(self, time_ms: Union[List, int]=None):
-        if self.time_ms is None:
-            self.time_ms = []
-        
         if self.type == EVENT:
             if isinstance(time_ms, list):
                 raise ValueError("Events cannot have multiple time_ms values")
-            self.time_ms.append(time_ms)
+            self.time_ms.insert(time_ms)
         elif self.type == STATE:
-            if isinstance(time_ms, float):
+            if not isinstance(time_ms, (list, tuple)):
                 raise ValueError("States needs a list of time_ms values")
-            self.time_ms.append(time_ms)
+            self.time_ms.insert(time_ms[0], time_ms[1])
+        self.dirty = True
             
     def delete(self, del_time_ms):
-        if self.time_ms is None:
-            return
-        
-        for n, t in enumerate(self.time_ms):
-            if self.type == EVENT:
-                _tr = [t, t+1]
-            else:
-                _tr = t
-
-            if del_time_ms >= _tr[0] and del_time_ms <= _tr[1]:
-                self.time_ms.pop(n)
+        # returns the removed times
+        idx = self.time_ms.find(del_time_ms)
+        removed = [self.time_ms[n] for n in idx]
+        if len(removed) > 0:
+            self.time_ms.remove(idx)
+            self.dirty = True
+        return removed
     
     def update_video_path(self, video_path: List[str]):
+        if video_path != self.video_path:
+            self.dirty = True
         self.video_path = video_path
+    
+    @property
+    def file_name(self):
+        return f"{PREFIX}_{self.name}.json"
             
     def save(self, path: str):
-        file_name = os.path.join(path, f"{PREFIX}_{self.name}.json")
+        # write to a temporary file and rename it, so the previous file is never left half-written
+        file_name = os.path.join(path, self.file_name)
         if self.video_path is None:
             raise ValueError("Please define video_path before saving by calling update_video_path()")
 
@@ -70,10 +77,14 @@ class BehavInfo:
             "type": self.type,
             "video_path": self.video_path,
             "color_code": self.color_code,
-            "time_ms": self.time_ms if self.time_ms is not None else []
+            "time_ms": self.time_ms.tolist()
         }
-        with open(file_name, "w") as f:
+        tmp_name = file_name + ".tmp"
+        with open(tmp_name, "w") as f:
             json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, file_name)
     
     @staticmethod
     def load(file_name: str):
@@ -87,15 +98,13 @@ class BehavInfo:
             type=data["type"],
             video_path=data["video_path"],
             color_code=data["color_code"],
-            time_ms=data.get("time_ms", [])
+            time_ms=data.get("time_ms", []),
+            dirty=False
         )
         
     @property
     def num(self):
-        if self.time_ms is None:
-            return 0
-        else:
-            return len(self.time_ms)
+        return len(self.time_ms)
         
         
 def is_valid_path(func):
@@ -105,35 +114,114 @@ def is_valid_path(func):
     return wrapper
         
 
-# TODO: change to singleton pattern?
+def _restore_collector(cls, state):
+    bcollector = cls.new_session()
+    bcollector.__dict__.update(state)
+    return bcollector
+
+
 class BehavCollector:
+    # BehavCollector() returns the default instance shared by the GUI.
+    # BehavCollector.new_session() returns an independent instance (batch jobs, threads, processes).
     def __new__(cls):
-        if not hasattr(cls, "_instance"):
+        if "_instance" not in cls.__dict__:
             cls._instance = super().__new__(cls)
+            cls._instance._reset()
         return cls._instance
     
     def __init__(self):
-        cls = type(self)
-        if not hasattr(cls, "_init"):
-            self.behav_set = []
-            self.video_path = []
-            cls._init = True
+        pass
+    
+    @classmethod
+    def new_session(cls):
+        bcollector = super().__new__(cls)
+        bcollector._reset()
+        return bcollector
+    
+    def _reset(self):
+        self.behav_set = []
+        self.video_path = []
+        self.journal = None
+        self.save_dir = None     # directory of the last save/load
+        self._saved_files = set() # behavior files written in save_dir
+    
+    def __reduce__(self):
+        # unpickling must not go through __new__, which returns the default instance
+        state = self.__dict__.copy()
+        state["journal"] = None
+        return (_restore_collector, (type(self), state))
+    
+    def attach_journal(self, journal, saved: bool=False):
+        # every modification is appended to the journal (see behav_journal.BehavJournal)
+        self.journal = journal
+        if journal is not None:
+            journal.compact(self, saved=saved)
+    
+    def _log(self, op: str, **kwargs):
+        if self.journal is None:
+            return
+        self.journal.append(op, **kwargs)
+        if self.journal.needs_compaction:
+            self.journal.compact(self)
         
     def update_video_path(self, video_path: List[str]):
         self.video_path = video_path
         for b in self.behav_set:
             b.update_video_path(video_path)
+        self._log("video_path", video_path=video_path)
     
     @is_valid_path
     def add_behav_time(self, behav_id, time_ms):
         if self.num <= behav_id:
             return
         self.behav_set[behav_id].append(time_ms)
+        self._log("add_time", behav_id=behav_id, time_ms=time_ms)
+        
+    def set_behav_times(self, behav_id, time_ms: TimeArray):
+        # replace all the times of a behavior
+        b = self.behav_set[behav_id]
+        if time_ms.is_event != (b.type == EVENT):
+            raise ValueError(f"Times do not match the type of behavior {b.name} ({b.type})")
+        b.time_ms = time_ms
+        b.dirty = True
+        self._log("set_times", behav_id=behav_id, time_ms=time_ms.tolist())
         
     def delete_behav_time(self, time_ms):
-        # remove all the times 
-        for b in self.behav_set:
-            b.delete(time_ms)
+        # remove all the times containing time_ms, returns [(behav_id, time_ms), ...] removed
+        removed = []
+        for bid, b in enumerate(self.behav_set):
+            removed.extend((bid, t) for t in b.delete(time_ms))
+        self._log("delete_time", time_ms=time_ms)
+        return removed
+    
+    # interval queries across all behaviors: each one is a binary search on the sorted
+    # TimeArray of every behavior, and returns (behav_id, time_ms) pairs
+    def active_at(self, time_ms: int):
+        return self.overlapping(time_ms, time_ms)
+    
+    def overlapping(self, t0: int, t1: int):
+        items = []
+        for bid, b in enumerate(self.behav_set):
+            items.extend((bid, b.time_ms[n]) for n in b.time_ms.overlapping(t0, t1))
+        return items
+    
+    def next(self, time_ms: int):
+        # the behavior starting first after time_ms, or None
+        found, t_found = None, None
+        for bid, b in enumerate(self.behav_set):
+            n = b.time_ms.next_index(time_ms)
+            if n is not None and (t_found is None or b.time_ms.onsets[n] < t_found):
+                found, t_found = (bid, b.time_ms[n]), b.time_ms.onsets[n]
+        return found
+    
+    def previous(self, time_ms: int):
+        # the behavior starting last before time_ms, or None
+        found, t_found = None, None
+        for bid, b in enumerate(self.behav_set):
+            n = b.time_ms.previous_index(time_ms)
+            if n is not None and (t_found is None or b.time_ms.onsets[n] > t_found):
+                found, t_found = (bid, b.time_ms[n]), b.time_ms.onsets[n]
+        return found
 
     def add_behav(self, name: str, note: str, type: str, color_code: str):
         # check first
@@ -152,17 +240,49 @@ class BehavCollector:
                 video_path=self.video_path
             )
         )
+        self._log("add_behav", name=name, note=note, type=type, color_code=color_code)
         
     def delete_behav(self, behav_id):
         self.behav_set.pop(behav_id)
+        self._log("delete_behav", behav_id=behav_id)
+    
+    def _is_save_dir(self, path_dir: str):
+        if self.save_dir is None or not os.path.isdir(self.save_dir):
+            return False
+        return os.path.samefile(self.save_dir, path_dir)
+    
+    @property
+    def is_dirty(self):
+        # True if there are changes not written to save_dir
+        if self.save_dir is None:
+            return self.num > 0
+        if any(b.dirty for b in self.behav_set):
+            return True
+        return set(b.file_name for b in self.behav_set) != self._saved_files
     
     @is_valid_path
     def save(self, path_dir: str):
-        if any(os.scandir(path_dir)):
+        # in the directory of the last save/load only the modified behaviors are rewritten
+        is_save_dir = self._is_save_dir(path_dir)
+        if not is_save_dir and any(os.scandir(path_dir)):
             raise ValueError(f"Directory {path_dir} is not empty")
         
+        files = set()
         for behav in self.behav_set:
-            behav.save(path_dir)
+            if not is_save_dir or behav.dirty or behav.file_name not in self._saved_files:
+                behav.save(path_dir)
+            files.add(behav.file_name)
+        
+        if is_save_dir:
+            # files of deleted or renamed behaviors
+            for f in self._saved_files - files:
+                if os.path.exists(os.path.join(path_dir, f)):
+                    os.remove(os.path.join(path_dir, f))
+        
+        for behav in self.behav_set:
+            behav.dirty = False
+        self.save_dir = path_dir
+        self._saved_files = files
         return True
     
     @is_valid_path
@@ -180,12 +300,15 @@ class BehavCollector:
         return True
     
     @staticmethod
-    def load(path_dir: str):
+    def load(path_dir: str, behav_collector: "BehavCollector"=None):
+        # loads into behav_collector (default instance if None)
         # if self.num != 0:
         #     raise ValueError("Behavior alread loaded. Please create a new BehavCollector instance.")
-        behav_collector = BehavCollector()
-        file_behav_set =  [f for f in os.listdir(path_dir) if PREFIX in f and ".json" in f]
+        if behav_collector is None:
+            behav_collector = BehavCollector()
+        file_behav_set =  [f for f in os.listdir(path_dir) if PREFIX in f and f.endswith(".json")]
         existing_names = [b.name for b in behav_collector.behav_set]
+        loaded_files = set()
 
         for f in file_behav_set:
             b = BehavInfo.load(os.path.join(path_dir, f))
@@ -195,6 +318,10 @@ class BehavCollector:
             
             existing_names.append(b.name)
             behav_collector.behav_set.append(b)
+            loaded_files.add(f)
+        
+        behav_collector.save_dir = path_dir
+        behav_collector._saved_files = loaded_files
         
         # sort
         behav_collector.behav_set = sorted(behav_collector.behav_set, key=lambda b: b.id)
@@ -206,11 +333,13 @@ class BehavCollector:
         return behav_collector
     
     @staticmethod
-    def load_header(file_name: str):
+    def load_header(file_name: str, behav_collector: "BehavCollector"=None):
+        # loads into behav_collector (default instance if None)
         with open(file_name, 'r') as f:
             header = json.load(f)
         
-        behav_collector = BehavCollector()
+        if behav_collector is None:
+            behav_collector = BehavCollector()
         existing_names = [b.name for b in behav_collector.behav_set]
 
         for name, tp, c, note in zip(header["behav_names"], header["types"], header["color_codes"], header["notes"]):
@@ -239,7 +368,14 @@ class BehavCollector:
         
     def set_value(self, key_id, key, value):
         assert self.num > key_id
-        setattr(self.behav_set[key_id], key, value)
+        b = self.behav_set[key_id]
+        if getattr(b, key) != value:
+            b.dirty = True
+        if key == "type" and value != b.type:
+            # keep the stored times consistent with the new type
+            b.time_ms = TimeArray.from_arrays(b.time_ms.onsets, b.time_ms.offsets, value == EVENT)
+        setattr(b, key, value)
+        self._log("set_value", key_id=key_id, key=key, value=value)
     
     def get_type(self, key_id):
         return self.get_value(key_id, "type")
@@ -0,0 +1,162 @@
+import numpy as np
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List
+from tqdm import tqdm
+from .behav_container import BehavCollector, BehavInfo, PREFIX
+from .behav_session import SESSION_EXT, read_session
+
+
+def _concat(arrs, dtype):
+    return np.concatenate(arrs).astype(dtype) if len(arrs) > 0 else np.empty(0, dtype=dtype)
+
+
+@dataclass
+class BehavDataset:
+    """
+    Columnar (structure-of-arrays) annotations of many sessions.
+    Each row is one bout: sessions[session[i]], behav_names[behavior[i]], onset[i], offset[i].
+    Events have offset == onset.
+    """
+    sessions: List[str]
+    behav_names: List[str]
+    behav_types: List[str]
+    session: np.ndarray  # int32
+    behavior: np.ndarray # int32
+    onset: np.ndarray    # int64, ms
+    offset: np.ndarray   # int64, ms
+
+    def __len__(self):
+        return len(self.onset)
+
+    @property
+    def duration(self):
+        return self.offset - self.onset
+
+    @staticmethod
+    def from_collector(bcollector: BehavCollector, session: str=None):
+        # single-session dataset of a BehavCollector
+        if session is None:
+            session = bcollector.save_dir if bcollector.save_dir is not None else ""
+        behav_set = bcollector.behav_set
+        onset = [np.array(b.time_ms.onsets) for b in behav_set]
+        offset = [np.array(b.time_ms.offsets) for b in behav_set]
+        behavior = [np.full(b.num, bid, dtype=np.int32) for bid, b in enumerate(behav_set)]
+        return BehavDataset(
+            sessions=[session],
+            behav_names=[b.name for b in behav_set],
+            behav_types=[b.type for b in behav_set],
+            session=np.zeros(sum(b.num for b in behav_set), dtype=np.int32),
+            behavior=_concat(behavior, np.int32),
+            onset=_concat(onset, np.int64),
+            offset=_concat(offset, np.int64)
+        )
+
+    def behav_id(self, name: str):
+        if name not in self.behav_names:
+            raise ValueError(f"Behavior {name} is not in the dataset")
+        return self.behav_names.index(name)
+
+    def select(self, sessions=None, behaviors=None):
+        # sub-dataset of the given session indices and behavior names (the lookup tables are kept)
+        mask = np.ones(len(self), dtype=bool)
+        if sessions is not None:
+            mask &= np.isin(self.session, np.asarray(sessions))
+        if behaviors is not None:
+            bids = [self.behav_id(b) if isinstance(b, str) else b for b in behaviors]
+            mask &= np.isin(self.behavior, np.asarray(bids))
+        return BehavDataset(
+            sessions=self.sessions,
+            behav_names=self.behav_names,
+            behav_types=self.behav_types,
+            session=self.session[mask],
+            behavior=self.behavior[mask],
+            onset=self.onset[mask],
+            offset=self.offset[mask]
+        )
+
+
+def read_behav_set(path: str):
+    # behaviors of one session: a directory of behav_*.json files or a session file
+    if path.endswith(SESSION_EXT):
+        _, behav_set = read_session(path)
+    else:
+        files = [f for f in os.listdir(path) if PREFIX in f and f.endswith(".json")]
+        behav_set = [BehavInfo.load(os.path.join(path, f)) for f in files]
+    return sorted(behav_set, key=lambda b: b.id)
+
+
+def _read_session_columns(path: str):
+    return [
+        (b.name, b.type, np.array(b.time_ms.onsets), np.array(b.time_ms.offsets))
+        for b in read_behav_set(path)
+    ]
+
+
+def load_sessions(paths: List[str], num_workers: int=None, tqdm_fn=None):
+    """
+    Load the annotations of many sessions in parallel (one process per session) into a BehavDataset.
+    paths: session directories (behav_*.json) or session files (.npz)
+    num_workers: number of processes (None: number of CPUs, 1: no process pool)
+    """
+    if tqdm_fn is None:
+        tqdm_fn = tqdm
+
+    results = [None] * len(paths)
+    bar = tqdm_fn(total=len(paths), desc="Loading sessions")
+    if num_workers == 1:
+        for n, path in enumerate(paths):
+            try:
+                results[n] = _read_session_columns(path)
+            except Exception as e:
+                warnings.warn(f"Failed to load session {path}: {e}")
+            bar.update()
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            futures = {pool.submit(_read_session_columns, path): n for n, path in enumerate(paths)}
+            for future in as_completed(futures):
+                n = futures[future]
+                try:
+                    results[n] = future.result()
+                except Exception as e:
+                    warnings.warn(f"Failed to load session {paths[n]}: {e}")
+                bar.update()
+    bar.close()
+
+    behav_names, behav_types = [], []
+    session, behavior, onset, offset = [], [], [], []
+    for sid, columns in enumerate(results):
+        if columns is None:
+            continue
+        for name, tp, on, off in columns:
+            if name not in behav_names:
+                behav_names.append(name)
+                behav_types.append(tp)
+            bid = behav_names.index(name)
+            if behav_types[bid] != tp:
+                warnings.warn(f"Behavior {name} is {tp} in {paths[sid]}, but {behav_types[bid]} in other sessions")
+            session.append(np.full(len(on), sid, dtype=np.int32))
+            behavior.append(np.full(len(on), bid, dtype=np.int32))
+            onset.append(on)
+            offset.append(off)
+
+    return BehavDataset(
+        sessions=list(paths),
+        behav_names=behav_names,
+        behav_types=behav_types,
+        session=_concat(session, np.int32),
+        behavior=_concat(behavior, np.int32),
+        onset=_concat(onset, np.int64),
+        offset=_concat(offset, np.int64)
+    )
+
+
+def as_dataset(data):
+    # BehavCollector -> single-session BehavDataset, BehavDataset -> itself
+    if isinstance(data, BehavCollector):
+        return BehavDataset.from_collector(data)
+    if isinstance(data, BehavDataset):
+        return data
+    raise ValueError(f"Expected a BehavCollector or a BehavDataset, got {type(data).__name__}")
@@ -1,57 +1,733 @@
 import cv2
+import json
+import numpy as np
 import os
+import queue
+import threading
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from dataclasses import asdict, dataclass
+from multiprocessing import get_context
+from typing import List, Union
 from .behav_container import BehavCollector, EVENT, STATE
+from .export_manifest import ExportManifest, file_checksum, part_name
+from .export_profile import FPS_WRITE, ExportProfile # FPS_WRITE: kept importable from here, where it was defined
+from .export_stats import REPORT_FILE, ExportStats
+from .frame_index import load_frame_index
+from .mosaic import MOSAIC, MosaicCapture, MosaicLayout
+from .snapshot_archive import ContactSheet, SnapshotArchive
 from tqdm import tqdm
 
 
-FPS_WRITE = 10
 PADDING_MS = 1000  # export window padding before/after behavior
+SWEEP_SEEK_GAP_MS = 30000 # sweep mode: seek instead of decoding through gaps longer than this
+JPEG_QUALITY = 95
+PIPELINE_QUEUE_SIZE = 32  # decoded frames buffered between the reader and writer threads of a clip
+MANIFEST_SAVE_S = 5       # interval of the manifest saves during an export
+
+
+@dataclass
+class EpochItem:
+    # one exported epoch: a clip (State) or a snapshot (Event), written as f"{prefix}({video id}).avi/.jpg"
+    behav_name: str
+    type: str
+    prefix: str
+    start_ms: int
+    end_ms: int
+
+    def window(self, duration_ms: float=None):
+        # time range of the frames to export
+        if self.type == EVENT:
+            return self.start_ms, self.start_ms
+        start_clip = max(0, self.start_ms - PADDING_MS)
+        end_clip = self.end_ms + PADDING_MS
+        if duration_ms is not None:
+            start_clip = max(0, min(start_clip, duration_ms))
+            end_clip = max(start_clip, min(end_clip, duration_ms))
+        return start_clip, end_clip
+
+    def file_name(self, vid: Union[int, str]):
+        return f"{self.prefix}({vid}).jpg" if self.type == EVENT else f"{self.prefix}({vid}).avi"
+
+
+def _epoch_names(b):
+    """
+    Output name (without the video id), start and end time of every epoch of the behavior b:
+    f"{name}_{start s}_{end s}" for a State and f"{name}_{time s}" for an Event. Epochs whose names
+    collide (in the same second) are named in ms instead, f"{name}_{start}ms_{end}ms" and f"{name}_{time}ms",
+    and epochs repeated with the same times are exported once.
+    """
+    if b.type == STATE:
+        times = [(t[0], t[1]) for t in b.time_ms]
+        names = [f"{b.name}_{start//1000}_{end//1000}" for start, end in times]
+    else:
+        times = [(t, t) for t in b.time_ms]
+        names = [f"{b.name}_{start//1000}" for start, _ in times]
+    counts = {}
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    
+    epochs, used = [], set()
+    for name, (start, end) in zip(names, times):
+        if counts[name] > 1:
+            name = f"{b.name}_{start}ms_{end}ms" if b.type == STATE else f"{b.name}_{start}ms"
+        if name in used:
+            warnings.warn(f"Epoch {name} of behavior {b.name} is repeated, it is exported once")
+            continue
+        used.add(name)
+        epochs.append((name, start, end))
+    return epochs
+
+
+def _draw_label(frame, label: str):
+    # burned-in text at the top left, readable on any background
+    scale = max(frame.shape[0] / 480, 0.35)
+    org = (4, int(16 * scale) + 4)
+    cv2.putText(frame, label, org, cv2.FONT_HERSHEY_SIMPLEX, 0.5 * scale, (0, 0, 0), 3, cv2.LINE_AA)
+    cv2.putText(frame, label, org, cv2.FONT_HERSHEY_SIMPLEX, 0.5 * scale, (255, 255, 255), 1, cv2.LINE_AA)
+    return frame
+
+
+class _ClipWriter:
+    # VideoWriter applying the export profile (decimation, crop, scale) before encoding
+    def __init__(self, extractor, file_name: str, vid, frame_size, source_fps: float):
+        self.profile = extractor.profile
+        self.stats = extractor.stats
+        self.file_name = file_name
+        self.vid = vid
+        self.draw_border = extractor._draw_behavior_border
+        self.writer = cv2.VideoWriter(
+            file_name, cv2.VideoWriter_fourcc(*self.profile.codec),
+            self.profile.output_fps(source_fps), self.profile.output_size(vid, frame_size)
+        )
+        self.num = 0
+
+    def write(self, frame, border: bool=False, label: str=None):
+        # returns whether the frame was written (not dropped by the decimation)
+        keep = self.num % self.profile.decimate == 0
+        self.num += 1
+        if not keep:
+            return False
+        t0 = time.perf_counter()
+        out = self.profile.apply(self.vid, frame)
+        if border or label is not None:
+            out = out.copy() if out is frame else out
+        if border:
+            out = self.draw_border(out)
+        if label is not None:
+            _draw_label(out, label)
+        self.writer.write(out)
+        self.stats.encode.add(time.perf_counter() - t0)
+        return True
+
+    def release(self):
+        self.writer.release()
+        self.stats.outputs += 1
+        if os.path.exists(self.file_name):
+            self.stats.bytes_written += os.path.getsize(self.file_name)
+
+
+def _highlight_worker(extractor, path_dir: str, vid, behav_name: str, items: List[EpochItem]):
+    # returns the counters of the worker, added to the ones of the main process
+    extractor.stats = ExportStats()
+    extractor._write_highlights(path_dir, vid, behav_name, items)
+    return extractor.stats
+
+
+def _sweep_worker(extractor, vid, items: List[EpochItem], result_queue):
+    # runs in a worker process, with its own capture; the result of every item goes to the main process
+    extractor.stats = ExportStats()
+    cap = extractor._open_capture(vid)
+    try:
+        extractor._sweep_capture(cap, vid, items, result_queue.put)
+    finally:
+        cap.release()
+    return extractor.stats
 
 
 class BehavExtractor:
-    def __init__(self, bcollector: BehavCollector):
+    def __init__(self, bcollector: BehavCollector, profile: ExportProfile=None):
         self.bcollector = bcollector
-        self.video_capture = [
-            cv2.VideoCapture(path) for path in bcollector.video_path if path is not None
-        ]
+        self.profile = profile if profile is not None else ExportProfile()
+        self.video_path = [path for path in bcollector.video_path if path is not None]
+        self.video_capture = [cv2.VideoCapture(path) for path in self.video_path]
+        self._frame_index = {}
+        self.manifest = None # ExportManifest of the last sweep/parallel export
+        self.mosaic = None   # MosaicLayout: all the videos tiled into one output per epoch
+        self.stats = ExportStats() # counters of the last export (of the extractor, without export)
+    
+    def __getstate__(self):
+        # captures cannot be pickled: workers open their own
+        state = self.__dict__.copy()
+        state["video_capture"] = []
+        state["_frame_index"] = {} # loaded again from the disk cache
+        return state
+    
+    def frame_index(self, vid: Union[int, str]):
+        # FrameIndex of video vid, None when it cannot be built (seeks fall back to CAP_PROP_POS_MSEC)
+        if vid == MOSAIC:
+            return self.frame_index(0) # time base of the mosaic
+        if vid not in self._frame_index:
+            try:
+                self._frame_index[vid] = load_frame_index(self.video_path[vid])
+            except Exception as e:
+                warnings.warn(f"Failed to index the frames of video {vid}: {e}")
+                self._frame_index[vid] = None
+        return self._frame_index[vid]
+    
+    def _seek(self, cap, vid: Union[int, str], t_ms: float):
+        # the next read gives the first frame at or after t_ms
+        index = self.frame_index(vid)
+        t0 = time.perf_counter()
+        if index is None or vid == MOSAIC:
+            cap.set(cv2.CAP_PROP_POS_MSEC, t_ms)
+            num_decoded = 0
+        else:
+            num_decoded = index.seek(cap, index.frame_after(t_ms))
+        self.stats.seeks += 1
+        self.stats.seek.add(time.perf_counter() - t0, num_decoded)
+    
+    def _read(self, cap):
+        t0 = time.perf_counter()
+        ret, frame = cap.read()
+        if ret:
+            self.stats.decode.add(time.perf_counter() - t0)
+        return ret, frame
+    
+    def _write_snapshot(self, file_name: str, vid: Union[int, str], frame):
+        t0 = time.perf_counter()
+        if not cv2.imwrite(file_name, self.profile.apply(vid, frame)):
+            return False
+        self.stats.encode.add(time.perf_counter() - t0)
+        self.stats.outputs += 1
+        self.stats.bytes_written += os.path.getsize(file_name)
+        return True
+    
+    def _video_ids(self):
+        # the outputs of every epoch: one per video, or a single mosaic
+        return [MOSAIC] if self.mosaic is not None else list(range(len(self.video_path)))
+    
+    def _open_capture(self, vid):
+        if vid == MOSAIC:
+            return MosaicCapture(
+                self.video_path, self.mosaic, [self.frame_index(n) for n in range(len(self.video_path))],
+                roi=self.profile.roi
+            )
+        return cv2.VideoCapture(self.video_path[vid])
         
-    def extract_epochs(self, path_dir: str, tqdm_fn=None):
-        if any(os.scandir(path_dir)):
+    def plan_epochs(self, path_dir: str):
+        # every epoch of every behavior, sorted by time, one per output name
+        items = []
+        for b in self.bcollector.behav_set:
+            for name, start_ms, end_ms in _epoch_names(b):
+                items.append(EpochItem(b.name, b.type, os.path.join(path_dir, name), start_ms, end_ms))
+        return sorted(items, key=lambda item: item.window()[0])
+        
+    def extract_epochs(self, path_dir: str, tqdm_fn=None, sweep: bool=False,
+                       num_workers: int=1, chunks_per_video: int=None, skip_existing: bool=False,
+                       resume: bool=True, mosaic: MosaicLayout=None):
+        # sweep: decode every video once from front to back for all the epochs,
+        # instead of seeking and decoding each epoch separately
+        # num_workers > 1: sweep the videos (split into chunks_per_video time chunks) in worker processes
+        # skip_existing: do not extract the clips/snapshots already in path_dir (sweep mode)
+        # sweep and parallel exports keep a manifest in path_dir (self.manifest), and with resume
+        # only extract the items that are missing or failed in it
+        # mosaic: decode all the videos in lockstep and write one tiled f"{prefix}(mosaic).avi/.jpg" (sweep mode)
+        # the counters of the export are in self.stats, and saved to path_dir/export_report.json
+        self.mosaic = mosaic
+        use_manifest = num_workers is None or num_workers > 1 or sweep or skip_existing or mosaic is not None
+        if not (use_manifest and resume) and not skip_existing and any(os.scandir(path_dir)):
             warnings.warn(f"Directory {path_dir} is not empty")
             
         if tqdm_fn is None:
             tqdm_fn = tqdm
         
+        self.stats = ExportStats()
+        t0 = time.perf_counter()
+        if use_manifest:
+            settings = self._export_settings()
+            self.manifest = ExportManifest.load(path_dir, settings) if resume else ExportManifest(path_dir, settings)
+        if num_workers is None or num_workers > 1:
+            done = self._extract_epochs_parallel(path_dir, tqdm_fn, num_workers, chunks_per_video, skip_existing)
+        elif use_manifest:
+            done = self._extract_epochs_sweep(path_dir, tqdm_fn, skip_existing)
+        else:
+            done = self._extract_epochs_serial(path_dir, tqdm_fn)
+        self.stats.wall_seconds = time.perf_counter() - t0
+        self.stats.save(os.path.join(path_dir, REPORT_FILE))
+        return done
+    
+    def _update_bar(self, bar, n: int=1):
+        # progress, with the throughput so far
+        bar.set_postfix_str(self.stats.summary(), refresh=False)
+        bar.update(n)
+    
+    def _extract_epochs_serial(self, path_dir: str, tqdm_fn):
+        # seek and extract every epoch separately
         for b in self.bcollector.behav_set:
-            bar = tqdm_fn(total=len(b.time_ms), desc=f"Extracting {b.name} epochs")
-            for n in range(len(b.time_ms)):
+            epochs = _epoch_names(b)
+            bar = tqdm_fn(total=len(epochs), desc=f"Extracting {b.name} epochs")
+            for n, (name, start_ms, end_ms) in enumerate(epochs):
                 try:
+                    prefix = os.path.join(path_dir, name)
                     if b.type == STATE:
-                        start_ms = b.time_ms[n][0]
-                        end_ms = b.time_ms[n][1]
-                        
-                        # name_start time_end time (video_id)
-                        prefix = os.path.join(path_dir, f"{b.name}_{start_ms//1000}_{end_ms//1000}")
                         self.extract_single_epoch(prefix, start_ms, end_ms)
                     elif b.type == EVENT:
-                        start_ms = b.time_ms[n]
-                        prefix = os.path.join(path_dir, f"{b.name}_{start_ms//1000}")
                         self.extract_single_event(prefix, start_ms)
                 except Exception as e:
                     warnings.warn(f"Failed to extract epoch {n} for behavior {b.name}: {e}")
-                bar.update()
+                self._update_bar(bar)
             bar.close()
         
         return True
     
-    def _get_video_duration_ms(self, cap):
+    def _export_settings(self):
+        # profile and mosaic layout, as they are read back from the manifest
+        settings = {
+            "profile": asdict(self.profile),
+            "mosaic": asdict(self.mosaic) if self.mosaic is not None else None
+        }
+        return json.loads(json.dumps(settings))
+    
+    def _plan_videos(self, path_dir: str, skip_existing: bool=False):
+        # epochs to extract from each video, recorded as pending in the manifest
+        # (the files kept by skip_existing are not managed by the manifest, and are written again
+        # when the directory was exported with other settings)
+        items = self.plan_epochs(path_dir)
+        skip_existing = skip_existing and not self.manifest.stale
+        plan, planned = [], []
+        for vid in self._video_ids():
+            todo = []
+            for item in items:
+                if self.manifest.is_done(item, vid):
+                    planned.append(item.file_name(vid))
+                elif not (skip_existing and os.path.exists(item.file_name(vid))):
+                    todo.append(item)
+            for item in todo:
+                self.manifest.plan(item, vid)
+                planned.append(item.file_name(vid))
+            plan.append((vid, todo))
+        self.manifest.prune(planned)
+        self.manifest.save()
+        return plan
+    
+    def _finish_export(self):
+        self.manifest.save()
+        summary = self.manifest.summary()
+        if len(summary["failed"]) > 0:
+            warnings.warn(
+                f"{len(summary['failed'])} of {summary['total']} epochs failed, see {self.manifest.file_name}"
+            )
+        return True
+    
+    def _extract_epochs_sweep(self, path_dir: str, tqdm_fn, skip_existing: bool=False):
+        plan = self._plan_videos(path_dir, skip_existing)
+        bar = tqdm_fn(total=sum(len(items) for _, items in plan), desc="Extracting epochs")
+        last_save = time.monotonic()
+        
+        def _report(result):
+            nonlocal last_save
+            self.manifest.finish(**result)
+            self._update_bar(bar)
+            if time.monotonic() - last_save > MANIFEST_SAVE_S:
+                self.manifest.save()
+                last_save = time.monotonic()
+        
+        for vid, items in plan:
+            cap = self.video_capture[vid] if vid != MOSAIC else self._open_capture(vid)
+            try:
+                self._sweep_capture(cap, vid, items, _report)
+            except Exception as e:
+                warnings.warn(f"Failed to extract epochs from video {vid}: {e}")
+                self.manifest.fail_pending([item.file_name(vid) for item in items], str(e))
+            finally:
+                if vid == MOSAIC:
+                    cap.release()
+        bar.close()
+        return self._finish_export()
+    
+    def _extract_epochs_parallel(self, path_dir: str, tqdm_fn, num_workers: int=None, chunks_per_video: int=None,
+                                 skip_existing: bool=False):
+        # one task per (video, time chunk); the chunks are consecutive runs of epochs sorted by time
+        plan = self._plan_videos(path_dir, skip_existing)
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        if chunks_per_video is None:
+            chunks_per_video = max(1, num_workers // max(len(plan), 1))
+        
+        def _split(items):
+            ids = np.array_split(np.arange(len(items)), chunks_per_video)
+            return [[items[i] for i in chunk] for chunk in ids if len(chunk) > 0]
+        
+        bar = tqdm_fn(total=sum(len(items) for _, items in plan), desc="Extracting epochs")
+        
+        def _drain(result_queue):
+            while True:
+                try:
+                    result = result_queue.get_nowait()
+                except queue.Empty:
+                    return
+                self.manifest.finish(**result)
+                self._update_bar(bar)
+        
+        for n in range(len(self.video_path)):
+            self.frame_index(n) # built once here, not by every worker
+        
+        # spawned, not forked: the export runs in the GUI process as well, whose Qt state must not be copied
+        context = get_context("spawn")
+        with context.Manager() as manager, ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as pool:
+            result_queue = manager.Queue()
+            futures = {
+                pool.submit(_sweep_worker, self, vid, chunk, result_queue): (vid, chunk)
+                for vid, items in plan for chunk in _split(items)
+            }
+            pending = set(futures)
+            last_save = time.monotonic()
+            while len(pending) > 0:
+                done, pending = wait(pending, timeout=0.1)
+                _drain(result_queue)
+                for future in done:
+                    try:
+                        self.stats.merge(future.result())
+                    except Exception as e:
+                        vid, chunk = futures[future]
+                        warnings.warn(f"Failed to extract epochs from video {vid}: {e}")
+                        _drain(result_queue)
+                        self.manifest.fail_pending([item.file_name(vid) for item in chunk], str(e))
+                if time.monotonic() - last_save > MANIFEST_SAVE_S:
+                    self.manifest.save()
+                    last_save = time.monotonic()
+            _drain(result_queue)
+        bar.close()
+        return self._finish_export()
+    
+    def _sweep_capture(self, cap, vid: Union[int, str], items: List[EpochItem], report=None):
+        # single pass over one video: each decoded frame goes to every clip whose window contains it,
+        # and to the snapshots of the events it shows
+        # report(result) is called for every finished item, with the keyword arguments of ExportManifest.finish
+        if not cap.isOpened():
+            raise ValueError("Video capture cannot be opened")
+        
+        duration_ms = self._get_video_duration_ms(cap, vid)
+        frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        source_fps = cap.get(cv2.CAP_PROP_FPS)
+        pending = sorted(((*item.window(duration_ms), item) for item in items), key=lambda w: w[0])
+        active = [] # [end_clip, item, writer]
+        
+        def _done(item, error: str=None):
+            # move the finished output to its name
+            file_name = item.file_name(vid)
+            result = {"file_name": file_name, "error": error}
+            if error is None:
+                try:
+                    os.replace(part_name(file_name), file_name)
+                    result.update(size=os.path.getsize(file_name), checksum=file_checksum(file_name))
+                except OSError as e:
+                    result["error"] = str(e)
+            if report is not None:
+                report(result)
+        
+        def _write_empty_clip(item):
+            self._open_writer(part_name(item.file_name(vid)), vid, frame_size, source_fps).release()
+            _done(item)
+        
+        try:
+            next_id, current_ms = 0, None
+            while next_id < len(pending) or len(active) > 0:
+                if len(active) == 0 and (current_ms is None or pending[next_id][0] - current_ms > SWEEP_SEEK_GAP_MS):
+                    self._seek(cap, vid, pending[next_id][0])
+                ret, frame = self._read(cap)
+                if not ret:
+                    break
+                current_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+                
+                for clip in [c for c in active if current_ms > c[0]]:
+                    clip[2].release()
+                    active.remove(clip)
+                    _done(clip[1])
+                
+                used = len(active) > 0
+                while next_id < len(pending) and pending[next_id][0] <= current_ms:
+                    _, end_clip, item = pending[next_id]
+                    next_id += 1
+                    used = True
+                    if item.type == EVENT:
+                        if self._write_snapshot(part_name(item.file_name(vid)), vid, frame):
+                            _done(item)
+                        else:
+                            _done(item, "Failed to write the snapshot")
+                    elif any(clip[1].file_name(vid) == item.file_name(vid) for clip in active):
+                        # never two writers on one file (the names of plan_epochs are unique)
+                        _done(item, f"Clip {item.file_name(vid)} is already being written")
+                    elif current_ms > end_clip:
+                        # window shorter than a frame interval
+                        _write_empty_clip(item)
+                    else:
+                        writer = self._open_writer(part_name(item.file_name(vid)), vid, frame_size, source_fps)
+                        active.append([end_clip, item, writer])
+                
+                for _, item, writer in active:
+                    writer.write(frame, border=item.start_ms <= current_ms <= item.end_ms)
+                if not used:
+                    self.stats.discarded += 1 # decoded through a gap between windows
+            
+            # the video ended before these windows
+            while len(active) > 0:
+                _, item, writer = active.pop(0)
+                writer.release()
+                _done(item)
+            for _, _, item in pending[next_id:]:
+                if item.type == EVENT:
+                    _done(item, f"Failed to read frame at {item.start_ms} ms for behavior {item.behav_name}")
+                else:
+                    _write_empty_clip(item)
+        finally:
+            # interrupted: the unfinished clips stay .part files
+            for _, _, writer in active:
+                writer.release()
+    
+    def export_highlights(self, path_dir: str, tqdm_fn=None, num_workers: int=1, mosaic: MosaicLayout=None):
+        """
+        Highlight reels: one clip per State behavior and video, f"{behav_name}_highlights({video id}).avi",
+        with all its bouts (padded) one after another. Every frame shows the bout index and the source time,
+        and the frames of the bouts have the red border.
+        A sidecar JSON (clip name + ".json") gives the source time of every clip frame and the clip frames of every bout.
+        num_workers: reels written in parallel processes (None: all cores)
+        """
+        if tqdm_fn is None:
+            tqdm_fn = tqdm
+        self.mosaic = mosaic
+        self.stats = ExportStats()
+        t0 = time.perf_counter()
+        by_behav = {}
+        for item in self.plan_epochs(path_dir):
+            if item.type == STATE:
+                by_behav.setdefault(item.behav_name, []).append(item)
+        tasks = [(vid, name, items) for name, items in by_behav.items() for vid in self._video_ids()]
+        
+        bar = tqdm_fn(total=len(tasks), desc="Exporting highlights")
+        if num_workers == 1:
+            for vid, name, items in tasks:
+                try:
+                    self._write_highlights(path_dir, vid, name, items)
+                except Exception as e:
+                    warnings.warn(f"Failed to export the highlights of {name} from video {vid}: {e}")
+                self._update_bar(bar)
+        else:
+            for n in range(len(self.video_path)):
+                self.frame_index(n) # built once here, not by every worker
+            with ProcessPoolExecutor(max_workers=num_workers, mp_context=get_context("spawn")) as pool:
+                futures = {
+                    pool.submit(_highlight_worker, self, path_dir, vid, name, items): (vid, name)
+                    for vid, name, items in tasks
+                }
+                for future in as_completed(futures):
+                    try:
+                        self.stats.merge(future.result())
+                    except Exception as e:
+                        vid, name = futures[future]
+                        warnings.warn(f"Failed to export the highlights of {name} from video {vid}: {e}")
+                    self._update_bar(bar)
+        bar.close()
+        self.stats.wall_seconds = time.perf_counter() - t0
+        return True
+    
+    def _write_highlights(self, path_dir: str, vid, behav_name: str, items: List[EpochItem]):
+        # the windows are decoded in time order; overlapping windows are decoded again from a seek
+        items = sorted(items, key=lambda item: item.start_ms)
+        file_name = os.path.join(path_dir, f"{behav_name}_highlights({vid}).avi")
+        cap = self._open_capture(vid)
+        writer = None
+        try:
+            if not cap.isOpened():
+                raise ValueError("Video capture cannot be opened")
+            duration_ms = self._get_video_duration_ms(cap, vid)
+            frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            source_fps = cap.get(cv2.CAP_PROP_FPS)
+            writer = self._open_writer(part_name(file_name), vid, frame_size, source_fps)
+            
+            source_ms, bouts = [], []
+            held = None      # (frame, time) read past the end of the previous window
+            last_ms = None   # time of the last frame used
+            for k, item in enumerate(items):
+                start_clip, end_clip = item.window(duration_ms)
+                overlap = last_ms is not None and start_clip <= last_ms
+                if last_ms is None or overlap or start_clip - last_ms > SWEEP_SEEK_GAP_MS:
+                    self._seek(cap, vid, start_clip)
+                    if held is not None:
+                        self.stats.discarded += 1
+                    held = None
+                
+                first_frame = len(source_ms)
+                label = f"{behav_name} #{k+1}/{len(items)}"
+                while True:
+                    if held is not None:
+                        (frame, current_ms), held = held, None
+                    else:
+                        ret, frame = self._read(cap)
+                        if not ret:
+                            break
+                        current_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+                    if current_ms < start_clip:
+                        self.stats.discarded += 1
+                        continue
+                    if current_ms > end_clip:
+                        held = (frame, current_ms)
+                        break
+                    last_ms = current_ms
+                    in_bout = item.start_ms <= current_ms <= item.end_ms
+                    if writer.write(frame, border=in_bout, label=f"{label}  {current_ms/1000:.3f} s"):
+                        source_ms.append(current_ms)
+                bouts.append({
+                    "bout": k,
+                    "onset_ms": int(item.start_ms),
+                    "offset_ms": int(item.end_ms),
+                    "first_frame": first_frame,
+                    "last_frame": len(source_ms) - 1 # < first_frame when no frame was written
+                })
+            if held is not None:
+                self.stats.discarded += 1
+            writer.release()
+            writer = None
+            os.replace(part_name(file_name), file_name)
+        finally:
+            if writer is not None:
+                writer.release()
+            cap.release()
+        
+        meta = {
+            "behav_name": behav_name,
+            "video_path": self.video_path if vid == MOSAIC else self.video_path[vid],
+            "fps": self.profile.output_fps(source_fps),
+            "bouts": bouts,
+            "source_ms": source_ms
+        }
+        with open(file_name + ".json", "w") as f:
+            json.dump(meta, f)
+        return file_name
+    
+    def _iter_snapshots(self, cap, vid: Union[int, str], items: List[EpochItem]):
+        # (item, frame, frame time) of every event in time order, decoding forward between close events
+        # (frame is None when the video ends before the event)
+        ok, frame, current_ms = False, None, None
+        used = True # the current frame was given for an event
+        for item in sorted(items, key=lambda item: item.start_ms):
+            if current_ms is None or item.start_ms - current_ms > SWEEP_SEEK_GAP_MS:
+                self._seek(cap, vid, item.start_ms)
+                if not used:
+                    self.stats.discarded += 1
+                ok, frame = self._read(cap)
+                current_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+                used = False
+            while ok and current_ms < item.start_ms - 1e-3:
+                if not used:
+                    self.stats.discarded += 1
+                ok, frame = self._read(cap)
+                current_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+                used = False
+            used = True
+            yield item, frame if ok else None, current_ms
+    
+    def export_snapshot_archive(self, file_name: str, tqdm_fn=None, chunk_size: int=None,
+                                contact_sheet_dir: str=None, mosaic: MosaicLayout=None):
+        """
+        Snapshots of all the Event behaviors written into one archive (.zip or .tar, see SnapshotArchive),
+        decoding every video once in time order instead of seeking for each event.
+        Entries are f"{behav_name}/{behav_name}_{time_ms}ms({video id}).jpg", and the index
+        (file_name + ".json") lists every snapshot with its archive part and the time of its frame.
+        contact_sheet_dir: also write contact sheets of every behavior there, f"{behav_name}({video id})_{page}.jpg"
+        """
+        if tqdm_fn is None:
+            tqdm_fn = tqdm
+        self.mosaic = mosaic
+        self.stats = ExportStats()
+        t0 = time.perf_counter()
+        items = [item for item in self.plan_epochs("") if item.type == EVENT]
+        vids = self._video_ids()
+        archive = SnapshotArchive(file_name, chunk_size)
+        snapshots, failed, sheet_pages = [], {}, []
+        added = set()
+        
+        bar = tqdm_fn(total=len(items)*len(vids), desc="Exporting snapshots")
+        try:
+            for vid in vids:
+                cap = self.video_capture[vid] if vid != MOSAIC else self._open_capture(vid)
+                sheets = {}
+                try:
+                    if not cap.isOpened():
+                        raise ValueError("Video capture cannot be opened")
+                    for item, frame, frame_ms in self._iter_snapshots(cap, vid, items):
+                        name = f"{item.behav_name}/{item.behav_name}_{int(item.start_ms)}ms({vid}).jpg"
+                        if name in added:
+                            pass # the same event annotated twice
+                        elif frame is None:
+                            failed[name] = f"Failed to read frame at {item.start_ms} ms"
+                        else:
+                            t_encode = time.perf_counter()
+                            frame = self.profile.apply(vid, frame)
+                            _, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                            self.stats.encode.add(time.perf_counter() - t_encode)
+                            self.stats.outputs += 1
+                            self.stats.bytes_written += len(data)
+                            added.add(name)
+                            snapshots.append({
+                                "name": name,
+                                "archive": os.path.basename(archive.add(name, data.tobytes())),
+                                "behav_name": item.behav_name,
+                                "time_ms": int(item.start_ms),
+                                "frame_ms": frame_ms,
+                                "vid": vid
+                            })
+                            if contact_sheet_dir is not None:
+                                if item.behav_name not in sheets:
+                                    prefix = os.path.join(contact_sheet_dir, f"{item.behav_name}({vid})")
+                                    sheets[item.behav_name] = ContactSheet(prefix)
+                                sheets[item.behav_name].add(frame, f"{item.start_ms/1000:.3f}s")
+                        self._update_bar(bar)
+                except Exception as e:
+                    warnings.warn(f"Failed to export snapshots from video {vid}: {e}")
+                    for item in items:
+                        name = f"{item.behav_name}/{item.behav_name}_{int(item.start_ms)}ms({vid}).jpg"
+                        if name not in added and name not in failed:
+                            failed[name] = str(e)
+                finally:
+                    if vid == MOSAIC:
+                        cap.release()
+                    for sheet in sheets.values():
+                        sheet.flush()
+                        sheet_pages.extend(sheet.pages)
+        finally:
+            archive.close()
+            bar.close()
+        self.stats.wall_seconds = time.perf_counter() - t0
+        
+        index = {
+            "archives": [os.path.basename(f) for f in archive.parts],
+            "snapshots": snapshots,
+            "failed": failed,
+            "contact_sheets": sheet_pages,
+            "stats": self.stats.report()
+        }
+        with open(file_name + ".json", "w") as f:
+            json.dump(index, f, indent=1)
+        if len(failed) > 0:
+            warnings.warn(f"{len(failed)} snapshots failed, see {file_name}.json")
+        return True
+    
+    def _get_video_duration_ms(self, cap, vid: int=None):
+        index = self.frame_index(vid) if vid is not None else None
+        if index is not None:
+            return index.duration_ms
         fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
         if fps <= 0:
             return None
         return (total_frames / fps) * 1000
 
+    def _open_writer(self, file_name: str, vid, frame_size, source_fps: float):
+        return _ClipWriter(self, file_name, vid, frame_size, source_fps)
+
     def _draw_behavior_border(self, frame):
         h, w = frame.shape[:2]
         cv2.rectangle(frame, (0, 0), (w - 1, h - 1), (0, 0, 255), 2)
@@ -65,41 +741,74 @@ class BehavExtractor:
             if not cap.isOpened():
                 raise ValueError("Video capture cannot be opened")
 
-            duration_ms = self._get_video_duration_ms(cap)
+            duration_ms = self._get_video_duration_ms(cap, n)
             start_clip = padded_start
             end_clip = padded_end
             if duration_ms is not None:
                 start_clip = max(0, min(start_clip, duration_ms))
                 end_clip = max(start_clip, min(end_clip, duration_ms))
             
-            writter = cv2.VideoWriter(
-                f"{prefix_video}({n}).avi",
-                cv2.VideoWriter_fourcc(*'XVID'),
-                FPS_WRITE,
-                (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            writter = self._open_writer(
+                f"{prefix_video}({n}).avi", n,
+                (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))),
+                cap.get(cv2.CAP_PROP_FPS)
             )
-            
-            cap.set(cv2.CAP_PROP_POS_MSEC, start_clip)
+            try:
+                self._run_clip_pipeline(cap, n, writter, start_ms, end_ms, start_clip, end_clip)
+            finally:
+                writter.release()
+
+    def _run_clip_pipeline(self, cap, vid: int, writter, start_ms: int, end_ms: int, start_clip: float, end_clip: float):
+        # decode and encode overlap: the reader thread fills a bounded queue that the writer thread empties
+        # (cv2 releases the GIL while decoding and encoding)
+        frames = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        errors = []
+
+        def _read():
+            try:
+                self._seek(cap, vid, start_clip)
+                while True:
+                    ret, frame = self._read(cap)
+                    if not ret:
+                        break
+                    current_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+                    if current_ms > end_clip:
+                        self.stats.discarded += 1
+                        break
+                    frames.put((frame, start_ms <= current_ms <= end_ms))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                frames.put(None)
+
+        def _write():
             while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                current_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
-                if current_ms > end_clip:
-                    break
-                if start_ms <= current_ms <= end_ms:
-                    frame = self._draw_behavior_border(frame)
-                writter.write(frame)
-            writter.release()
+                frame = frames.get()
+                if frame is None:
+                    return
+                if len(errors) > 0:
+                    continue # keep draining so that the reader is never blocked
+                try:
+                    writter.write(*frame)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=_read, daemon=True), threading.Thread(target=_write, daemon=True)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        if len(errors) > 0:
+            raise errors[0]
 
     def extract_single_event(self, perfix_event, start_ms: int):
         for n, cap in enumerate(self.video_capture):
             if not cap.isOpened():
                 raise ValueError("Video capture cannot be opened")
             
-            cap.set(cv2.CAP_PROP_POS_MSEC, start_ms)
-            ret, frame = cap.read()
+            self._seek(cap, n, start_ms)
+            ret, frame = self._read(cap)
             if not ret:
                 raise ValueError(f"Failed to read frame at {perfix_event} ms")
             
-            cv2.imwrite(f"{perfix_event}({n}).jpg", frame)
+            self._write_snapshot(f"{perfix_event}({n}).jpg", n, frame)
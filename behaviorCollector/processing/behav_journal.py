@@ -0,0 +1,307 @@
+import json
+import os
+import re
+import shutil
+import time
+import warnings
+from .behav_container import BehavCollector, BehavInfo, EVENT, PREFIX
+from .time_array import TimeArray
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".behaviorCollector", "journal")
+JOURNAL_FILE = "journal.jsonl"
+SNAPSHOT_DIR = "snapshot"
+SNAPSHOT_META = "snapshot.json"
+LOCK_FILE = "lock"
+COMPACT_RECORDS = 10000 # compact the journal into a snapshot after this many records
+
+FSYNC_ALWAYS = "always"     # fsync every record
+FSYNC_INTERVAL = "interval" # fsync at most once per fsync_interval_s
+FSYNC_NEVER = "never"       # flush only (survives an application crash, not an OS crash)
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+
+class BehavJournal:
+    """
+    Append-only journal of BehavCollector modifications.
+    path_dir/
+        journal.jsonl   : one JSON record per modification {"seq", "op", ...}
+        snapshot/       : behav_*.json files and snapshot.json ({"seq", "video_path", "saved", "behav_files"})
+        lock            : locked by the process using the journal (see acquire)
+    Records up to the snapshot seq are already included in the snapshot, so a crash
+    at any point of the compaction replays to the same state.
+    """
+    def __init__(self, path_dir: str=JOURNAL_DIR, fsync: str=FSYNC_INTERVAL,
+                 fsync_interval_s: float=1.0, compact_records: int=COMPACT_RECORDS):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unexpected fsync policy {fsync}, must be one of {FSYNC_POLICIES}")
+        self.path_dir = path_dir
+        self.fsync = fsync
+        self.fsync_interval_s = fsync_interval_s
+        self.compact_records = compact_records
+
+        self.seq = 0
+        self.num_records = 0
+        self._file = None
+        self._last_sync = 0
+        self._lock = None
+
+    @classmethod
+    def acquire(cls, base_dir: str=JOURNAL_DIR, **kwargs):
+        """
+        Journal of one running instance: base_dir or a f"{base_dir}-{n}" directory, locked until release().
+        A directory that is not locked by another instance and has unsaved behaviors (left by a crash)
+        is taken first, so that it is offered for recovery; otherwise a free one, or a new one.
+        """
+        parent, name = os.path.split(os.path.abspath(base_dir))
+        os.makedirs(parent, exist_ok=True)
+        numbers = [int(d[len(name)+1:]) for d in os.listdir(parent) if re.fullmatch(re.escape(name) + r"-\d+", d)]
+        free = None
+        for path_dir in [base_dir] + [f"{base_dir}-{n}" for n in sorted(numbers)]:
+            journal = cls(path_dir, **kwargs)
+            if not journal.lock():
+                continue
+            if journal.has_unsaved():
+                if free is not None:
+                    free.release()
+                return journal
+            if free is None:
+                free = journal
+            else:
+                journal.release()
+        n = max(numbers, default=0)
+        while free is None:
+            n += 1
+            journal = cls(f"{base_dir}-{n}", **kwargs)
+            if journal.lock():
+                free = journal
+        return free
+
+    def lock(self):
+        # False when another process holds the lock (released by the OS when that process ends)
+        if self._lock is not None:
+            return True
+        os.makedirs(self.path_dir, exist_ok=True)
+        f = open(os.path.join(self.path_dir, LOCK_FILE), "a+")
+        try:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock = f
+        return True
+
+    def release(self):
+        # close the journal and unlock its directory
+        self.close()
+        if self._lock is not None:
+            if os.name == "nt":
+                self._lock.seek(0)
+                msvcrt.locking(self._lock.fileno(), msvcrt.LK_UNLCK, 1)
+            self._lock.close()
+            self._lock = None
+
+    @property
+    def journal_file(self):
+        return os.path.join(self.path_dir, JOURNAL_FILE)
+
+    @property
+    def snapshot_dir(self):
+        return os.path.join(self.path_dir, SNAPSHOT_DIR)
+
+    @property
+    def needs_compaction(self):
+        return self.num_records >= self.compact_records
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(self.path_dir, exist_ok=True)
+            self._file = open(self.journal_file, "a", encoding="utf-8")
+        return self._file
+
+    def append(self, op: str, **kwargs):
+        self.seq += 1
+        record = {"seq": self.seq, "op": op, **kwargs}
+        f = self._open()
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        self.num_records += 1
+
+        now = time.monotonic()
+        if self.fsync == FSYNC_ALWAYS or \
+           (self.fsync == FSYNC_INTERVAL and now - self._last_sync >= self.fsync_interval_s):
+            os.fsync(f.fileno())
+            self._last_sync = now
+
+    def sync(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def compact(self, bcollector: BehavCollector, saved: bool=False):
+        # write the current state as a snapshot in the regular save format, then truncate the journal
+        os.makedirs(self.path_dir, exist_ok=True)
+        tmp_dir = self.snapshot_dir + ".tmp"
+        old_dir = self.snapshot_dir + ".old"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        for b in bcollector.behav_set:
+            if b.video_path is None:
+                b.update_video_path(bcollector.video_path)
+            b.save(tmp_dir)
+        # the records refer to behaviors by their position in behav_set, which is kept with the files
+        meta = {"seq": self.seq, "video_path": bcollector.video_path, "saved": saved,
+                "behav_files": [b.file_name for b in bcollector.behav_set]}
+        with open(os.path.join(tmp_dir, SNAPSHOT_META), "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.isdir(self.snapshot_dir):
+            os.replace(self.snapshot_dir, old_dir)
+        os.replace(tmp_dir, self.snapshot_dir)
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        with open(self.journal_file, "w"):
+            pass
+        self.num_records = 0
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def clear(self):
+        self.close()
+        for d in (self.snapshot_dir, self.snapshot_dir + ".tmp", self.snapshot_dir + ".old"):
+            shutil.rmtree(d, ignore_errors=True)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self.seq = 0
+        self.num_records = 0
+
+    def set_aside(self):
+        # move the journal to a new directory next to path_dir, where it is not compacted or cleared;
+        # returns that directory (None when there is no journal)
+        is_locked = self._lock is not None
+        self.release()
+        self.seq = 0
+        self.num_records = 0
+        if not os.path.isdir(self.path_dir):
+            return None
+        backup_dir = f"{self.path_dir}.{time.strftime('%Y%m%d-%H%M%S')}"
+        os.replace(self.path_dir, backup_dir)
+        if os.path.exists(os.path.join(backup_dir, LOCK_FILE)):
+            os.remove(os.path.join(backup_dir, LOCK_FILE))
+        if is_locked:
+            self.lock()
+        return backup_dir
+
+    def _find_snapshot(self):
+        # an interrupted compaction can leave the previous snapshot as .old
+        for d in (self.snapshot_dir, self.snapshot_dir + ".old"):
+            if os.path.exists(os.path.join(d, SNAPSHOT_META)):
+                return d
+        return None
+
+    def _read_records(self):
+        if not os.path.exists(self.journal_file):
+            return []
+        records = []
+        with open(self.journal_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # the last record can be cut by a crash while writing
+                    warnings.warn(f"Journal {self.journal_file} ends with an incomplete record")
+                    break
+        return records
+
+    def has_unsaved(self):
+        # modifications after the last save: records after the last "saved" record (see mark_saved),
+        # or without records after the snapshot, the snapshot itself
+        seq, saved = 0, None
+        snapshot_dir = self._find_snapshot()
+        if snapshot_dir is not None:
+            with open(os.path.join(snapshot_dir, SNAPSHOT_META), "r") as f:
+                meta = json.load(f)
+            seq, saved = meta["seq"], meta.get("saved", False)
+        for record in self._read_records():
+            if record["seq"] > seq:
+                saved = record["op"] == "saved"
+        return saved is not None and not saved
+
+    def mark_saved(self):
+        # the behaviors were saved: a record instead of a snapshot, so that a save only writes what it modified
+        self.append("saved")
+        self.sync()
+
+    def recover(self, bcollector: BehavCollector=None):
+        # rebuild the BehavCollector (default instance if None) from the snapshot and the journal records after it
+        if bcollector is None:
+            bcollector = BehavCollector()
+        journal, bcollector.journal = bcollector.journal, None
+
+        seq = 0
+        snapshot_dir = self._find_snapshot()
+        if snapshot_dir is not None:
+            with open(os.path.join(snapshot_dir, SNAPSHOT_META), "r") as f:
+                meta = json.load(f)
+            seq = meta["seq"]
+            bcollector.video_path = meta["video_path"]
+            if "behav_files" in meta:
+                behav_set = [BehavInfo.load(os.path.join(snapshot_dir, f)) for f in meta["behav_files"]]
+            else:
+                # snapshot written before the order was kept
+                file_behav_set = [f for f in os.listdir(snapshot_dir) if f.startswith(PREFIX) and f.endswith(".json")]
+                behav_set = sorted([BehavInfo.load(os.path.join(snapshot_dir, f)) for f in file_behav_set], key=lambda b: b.id)
+            bcollector.behav_set = behav_set
+
+        for record in self._read_records():
+            if record["seq"] <= seq:
+                continue
+            self._replay(bcollector, record)
+            seq = record["seq"]
+
+        self.seq = seq
+        bcollector.journal = journal
+        return bcollector
+
+    @staticmethod
+    def _replay(bcollector: BehavCollector, record: dict):
+        op = record["op"]
+        if op == "video_path":
+            bcollector.update_video_path(record["video_path"])
+        elif op == "add_behav":
+            bcollector.add_behav(record["name"], record["note"], record["type"], record["color_code"])
+        elif op == "delete_behav":
+            bcollector.delete_behav(record["behav_id"])
+        elif op == "set_value":
+            bcollector.set_value(record["key_id"], record["key"], record["value"])
+        elif op == "add_time":
+            bcollector.add_behav_time(record["behav_id"], record["time_ms"])
+        elif op == "set_times":
+            b = bcollector.behav_set[record["behav_id"]]
+            bcollector.set_behav_times(record["behav_id"], TimeArray.from_list(record["time_ms"], b.type == EVENT))
+        elif op == "delete_time":
+            bcollector.delete_behav_time(record["time_ms"])
+        elif op == "saved":
+            pass
+        else:
+            raise ValueError(f"Unexpected journal operation {op}")
@@ -0,0 +1,98 @@
+import cv2
+import json
+import numpy as np
+from .behav_container import BehavCollector
+
+
+CHUNK_FRAMES = 1 << 20 # frames rasterized at once
+
+
+def read_video_info(video_path: str):
+    # (fps, frame_count), same as VideoViewerWindow._load_video_info
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Video {video_path} cannot be opened")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if fps <= 1e-3:
+        raise ValueError(f"Invalid fps ({fps}) in {video_path}")
+    return fps, frame_count
+
+
+def frame_ranges(bcollector: BehavCollector, fps: float):
+    # per behavior: sorted first frames and sorted (last frame + 1) of every bout
+    # a State covers the frames whose time is in [onset, offset]; an Event marks the frame showing it
+    eps = 1e-6
+    ranges = []
+    for b in bcollector.behav_set:
+        onset = np.asarray(b.time_ms.onsets, dtype=np.float64) * fps / 1000
+        offset = np.asarray(b.time_ms.offsets, dtype=np.float64) * fps / 1000
+        if b.time_ms.is_event:
+            first = np.floor(onset + eps).astype(np.int64)
+            stop = first + 1
+        else:
+            first = np.ceil(onset - eps).astype(np.int64)
+            stop = np.floor(offset + eps).astype(np.int64) + 1
+            valid = stop > first
+            first, stop = first[valid], stop[valid]
+        ranges.append((np.sort(first), np.sort(stop)))
+    return ranges
+
+
+def rasterize(ranges, f0: int, f1: int):
+    # (f1-f0, behaviors) uint8 labels: a frame is active when more bouts started than stopped before it
+    frames = np.arange(f0, f1, dtype=np.int64)
+    labels = np.zeros((f1-f0, len(ranges)), dtype=np.uint8)
+    for bid, (first, stop) in enumerate(ranges):
+        active = np.searchsorted(first, frames, side="right") - np.searchsorted(stop, frames, side="right")
+        labels[:, bid] = active > 0
+    return labels
+
+
+def behavior_matrix(bcollector: BehavCollector, fps: float, num_frames: int):
+    # in-memory (frames, behaviors) uint8 label matrix
+    return rasterize(frame_ranges(bcollector, fps), 0, num_frames)
+
+
+def export_behavior_matrix(bcollector: BehavCollector, file_name: str, video_path: str=None,
+                           fps: float=None, num_frames: int=None, bitpack: bool=False,
+                           chunk_frames: int=CHUNK_FRAMES):
+    """
+    Write the (frames, behaviors) label matrix aligned to the video frames into a .npy file,
+    chunk by chunk through a memory map, so the full matrix is never held in memory.
+    bitpack: pack 8 behaviors per byte along the behavior axis (np.unpackbits(axis=1) to restore)
+    A sidecar JSON (file_name + ".json") stores fps, number of frames and behavior names.
+    """
+    if fps is None or num_frames is None:
+        if video_path is None:
+            video_path = next((p for p in bcollector.video_path if p is not None), None)
+            if video_path is None:
+                raise ValueError("Please give video_path, or fps and num_frames")
+        _fps, _num_frames = read_video_info(video_path)
+        fps = _fps if fps is None else fps
+        num_frames = _num_frames if num_frames is None else num_frames
+
+    num_behav = bcollector.num
+    num_cols = (num_behav + 7) // 8 if bitpack else num_behav
+    out = np.lib.format.open_memmap(file_name, mode="w+", dtype=np.uint8, shape=(num_frames, num_cols))
+
+    ranges = frame_ranges(bcollector, fps)
+    for f0 in range(0, num_frames, chunk_frames):
+        f1 = min(f0 + chunk_frames, num_frames)
+        labels = rasterize(ranges, f0, f1)
+        out[f0:f1] = np.packbits(labels, axis=1) if bitpack else labels
+    out.flush()
+    del out
+
+    meta = {
+        "fps": fps,
+        "num_frames": num_frames,
+        "behav_names": [b.name for b in bcollector.behav_set],
+        "behav_types": [b.type for b in bcollector.behav_set],
+        "bitpack": bitpack,
+        "video_path": video_path
+    }
+    with open(file_name + ".json", "w") as f:
+        json.dump(meta, f, indent=4)
+    return True
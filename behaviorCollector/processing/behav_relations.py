@@ -0,0 +1,124 @@
+import numpy as np
+from typing import Union
+from .behav_container import BehavCollector, EVENT, STATE
+from .behav_dataset import BehavDataset, as_dataset
+
+
+def _timeline(ds: BehavDataset):
+    # onsets/offsets of every session placed one after another on a single time axis,
+    # so that sorting never mixes bouts of different sessions
+    if len(ds) == 0:
+        return ds.onset, ds.offset
+    span = int(ds.offset.max()) - min(int(ds.onset.min()), 0) + 2
+    shift = ds.session.astype(np.int64) * span
+    return ds.onset + shift, ds.offset + shift
+
+
+def _behav_ids(ds: BehavDataset, tp: str):
+    ids = np.array([n for n, t in enumerate(ds.behav_types) if t == tp], dtype=np.int64)
+    lut = np.full(len(ds.behav_names), -1, dtype=np.int64) # behavior id -> row/column
+    lut[ids] = np.arange(len(ids))
+    return ids, lut
+
+
+def transition_matrix(data: Union[BehavCollector, BehavDataset], normalize: bool=False, max_gap_ms: int=None):
+    """
+    First-order transitions between State behaviors: matrix[i, j] counts bouts of state j
+    starting next after a bout of state i (in the same session).
+    normalize: divide each row by its sum (transition probabilities)
+    max_gap_ms: ignore transitions whose next onset is more than max_gap_ms after the previous offset
+    Returns (state names, matrix)
+    """
+    ds = as_dataset(data)
+    ids, lut = _behav_ids(ds, STATE)
+    n = len(ids)
+
+    mask = np.isin(ds.behavior, ids)
+    onset, offset = _timeline(ds)
+    onset, offset = onset[mask], offset[mask]
+    session, behavior = ds.session[mask], lut[ds.behavior[mask]]
+
+    order = np.argsort(onset, kind="stable")
+    prev, nxt = order[:-1], order[1:]
+    valid = session[prev] == session[nxt]
+    if max_gap_ms is not None:
+        valid &= onset[nxt] - offset[prev] <= max_gap_ms
+    matrix = np.bincount(behavior[prev][valid] * n + behavior[nxt][valid], minlength=n*n).reshape(n, n)
+
+    if normalize:
+        total = matrix.sum(axis=1, keepdims=True)
+        matrix = np.divide(matrix, total, out=np.zeros(matrix.shape), where=total > 0)
+    return [ds.behav_names[i] for i in ids], matrix
+
+
+def _merge_intervals(onset: np.ndarray, offset: np.ndarray):
+    # union of the intervals as sorted, disjoint (starts, ends)
+    if len(onset) == 0:
+        return onset, offset
+    order = np.argsort(onset, kind="stable")
+    onset, offset = onset[order], offset[order]
+    first = np.ones(len(onset), dtype=bool)
+    first[1:] = onset[1:] > np.maximum.accumulate(offset)[:-1]
+    return onset[first], np.maximum.reduceat(offset, np.flatnonzero(first))
+
+
+def _covered_before(starts: np.ndarray, ends: np.ndarray, t: np.ndarray):
+    # total length of the sorted, disjoint intervals (starts, ends) before each time of t
+    cum = np.concatenate(([0], np.cumsum(ends - starts)))
+    k = np.searchsorted(starts, t, side="right") - 1 # last interval starting at or before t
+    inside = np.clip(t - starts[np.maximum(k, 0)], 0, (ends - starts)[np.maximum(k, 0)])
+    return np.where(k >= 0, cum[np.maximum(k, 0)] + inside, 0)
+
+
+def cooccurrence_matrix(data: Union[BehavCollector, BehavDataset]):
+    """
+    Total time (ms) two State behaviors are active together, from the union of the bouts of every state
+    and, for every pair, a binary search of the intervals of one state over the other (memory linear in the bouts).
+    The diagonal is the time each state is active (overlapping bouts of one state counted once).
+    Returns (state names, matrix)
+    """
+    ds = as_dataset(data)
+    ids, _ = _behav_ids(ds, STATE)
+    n = len(ids)
+    onset, offset = _timeline(ds)
+
+    merged = []
+    for sid in ids:
+        is_state = ds.behavior == sid
+        merged.append(_merge_intervals(onset[is_state].astype(np.int64), offset[is_state].astype(np.int64)))
+
+    matrix = np.zeros((n, n), dtype=np.int64)
+    for i in range(n):
+        starts, ends = merged[i]
+        matrix[i, i] = np.sum(ends - starts)
+        for j in range(i + 1, n):
+            if len(starts) == 0 or len(merged[j][0]) == 0:
+                continue
+            # time of state j covered inside every interval of state i
+            covered = _covered_before(*merged[j], ends) - _covered_before(*merged[j], starts)
+            matrix[i, j] = matrix[j, i] = np.sum(covered)
+    return [ds.behav_names[i] for i in ids], matrix
+
+
+def event_in_state_matrix(data: Union[BehavCollector, BehavDataset]):
+    """
+    matrix[i, j] counts the events of Event behavior i occurring during a bout of State behavior j
+    (onset <= t <= offset, in the same session).
+    Returns (event names, state names, matrix)
+    """
+    ds = as_dataset(data)
+    state_ids, _ = _behav_ids(ds, STATE)
+    event_ids, event_lut = _behav_ids(ds, EVENT)
+    onset, offset = _timeline(ds)
+
+    is_event = np.isin(ds.behavior, event_ids)
+    event_t, event_row = onset[is_event], event_lut[ds.behavior[is_event]]
+
+    matrix = np.zeros((len(event_ids), len(state_ids)), dtype=np.int64)
+    for j, sid in enumerate(state_ids):
+        is_state = ds.behavior == sid
+        starts, ends = np.sort(onset[is_state]), np.sort(offset[is_state])
+        active = np.searchsorted(starts, event_t, side="right") - np.searchsorted(ends, event_t, side="left") > 0
+        matrix[:, j] = np.bincount(event_row[active], minlength=len(event_ids))
+
+    return [ds.behav_names[i] for i in event_ids], [ds.behav_names[i] for i in state_ids], matrix
@@ -0,0 +1,135 @@
+import numpy as np
+import json
+import os
+from functools import partial
+from typing import List
+from .behav_container import BehavInfo, BehavCollector, EVENT, PREFIX
+from .time_array import TimeArray
+
+
+# Single-file session (.npz)
+# - header: JSON (uint8 bytes) with the video path and the behavior information
+# - onset_{n}: onsets of the n-th behavior, delta-encoded (first value, then differences)
+# - duration_{n}: offset - onset of the n-th behavior (States only)
+# Every array is stored compressed with the smallest integer dtype that fits.
+# Time arrays are only read when the times of a behavior are accessed.
+SESSION_EXT = ".npz"
+SESSION_VERSION = 1
+
+
+def _compact(arr: np.ndarray):
+    if len(arr) == 0:
+        return arr.astype(np.uint8)
+    dtype = np.result_type(np.min_scalar_type(arr.min()), np.min_scalar_type(arr.max()))
+    return arr.astype(dtype)
+
+
+def _encode_times(time_ms: TimeArray):
+    onset = np.asarray(time_ms.onsets, dtype=np.int64)
+    arrays = {"onset": _compact(np.diff(onset, prepend=0))}
+    if not time_ms.is_event:
+        arrays["duration"] = _compact(np.asarray(time_ms.offsets, dtype=np.int64) - onset)
+    return arrays
+
+
+def _read_times(file_name: str, n: int, is_event: bool):
+    with np.load(file_name, allow_pickle=False) as data:
+        onset = np.cumsum(data[f"onset_{n}"].astype(np.int64))
+        if is_event:
+            return onset, onset
+        return onset, onset + data[f"duration_{n}"].astype(np.int64)
+
+
+def write_session(file_name: str, behav_set: List[BehavInfo], video_path: List[str]):
+    header = {
+        "version": SESSION_VERSION,
+        "video_path": video_path,
+        "behaviors": []
+    }
+    arrays = {}
+    for n, b in enumerate(behav_set):
+        header["behaviors"].append({
+            "name": b.name,
+            "id": b.id,
+            "note": b.note,
+            "type": b.type,
+            "video_path": b.video_path,
+            "color_code": b.color_code,
+            "num": b.num
+        })
+        for key, arr in _encode_times(b.time_ms).items():
+            arrays[f"{key}_{n}"] = arr
+
+    arrays["header"] = np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8)
+    with open(file_name, "wb") as f: # file object: numpy does not append the extension
+        np.savez_compressed(f, **arrays)
+    return True
+
+
+def read_session(file_name: str):
+    # returns (video_path, behav_set); the times of each behavior are loaded lazily
+    with np.load(file_name, allow_pickle=False) as data:
+        header = json.loads(data["header"].tobytes().decode("utf-8"))
+
+    if header.get("version", 0) > SESSION_VERSION:
+        raise ValueError(f"Unsupported session version {header['version']} in {file_name}")
+
+    file_name = os.path.abspath(file_name)
+    behav_set = []
+    for n, info in enumerate(header["behaviors"]):
+        is_event = info["type"] == EVENT
+        behav_set.append(BehavInfo(
+            name=info["name"],
+            id=info["id"],
+            note=info.get("note", ""),
+            type=info["type"],
+            video_path=info["video_path"],
+            color_code=info["color_code"],
+            time_ms=TimeArray.lazy(partial(_read_times, file_name, n, is_event), is_event)
+        ))
+    return header.get("video_path", []), behav_set
+
+
+def save_session(bcollector: BehavCollector, file_name: str):
+    return write_session(file_name, bcollector.behav_set, bcollector.video_path)
+
+
+def load_session(file_name: str, behav_collector: BehavCollector=None):
+    # same behavior as BehavCollector.load, but from a single session file
+    if behav_collector is None:
+        behav_collector = BehavCollector()
+    existing_names = [b.name for b in behav_collector.behav_set]
+
+    _, behav_set = read_session(file_name)
+    for b in behav_set:
+        if b.name in existing_names:
+            print(f"Behavior {b.name} already exists.")
+            continue
+        existing_names.append(b.name)
+        behav_collector.behav_set.append(b)
+
+    behav_collector.behav_set = sorted(behav_collector.behav_set, key=lambda b: b.id)
+    return behav_collector
+
+
+def json_to_session(path_dir: str, file_name: str):
+    # convert a directory of behav_*.json files into a single session file
+    file_behav_set = [f for f in os.listdir(path_dir) if PREFIX in f and f.endswith(".json")]
+    behav_set = sorted(
+        [BehavInfo.load(os.path.join(path_dir, f)) for f in file_behav_set],
+        key=lambda b: b.id
+    )
+    if len(behav_set) == 0:
+        raise ValueError(f"No behavior data found in {path_dir}")
+    return write_session(file_name, behav_set, behav_set[0].video_path)
+
+
+def session_to_json(file_name: str, path_dir: str):
+    # convert a session file back into the behav_*.json layout
+    if any(os.scandir(path_dir)):
+        raise ValueError(f"Directory {path_dir} is not empty")
+
+    _, behav_set = read_session(file_name)
+    for b in behav_set:
+        b.save(path_dir)
+    return True
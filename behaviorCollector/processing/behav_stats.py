@@ -0,0 +1,105 @@
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Union
+from .behav_container import BehavCollector
+from .behav_dataset import BehavDataset, as_dataset
+
+
+BIN_MS = 60000 # default bin for the bout rate (1 min)
+
+
+@dataclass
+class EthogramStats:
+    """
+    Per session x behavior statistics (times in ms).
+    Behaviors without any bout in a session have NaN mean/median/latency.
+    bout_count_bin[s, b, k] counts the onsets in [bin_edges[k], bin_edges[k+1]),
+    and bout_rate is the same count per minute.
+    """
+    sessions: List[str]
+    behav_names: List[str]
+    total_duration: np.ndarray # (sessions, behaviors)
+    bout_count: np.ndarray     # (sessions, behaviors)
+    mean_bout: np.ndarray      # (sessions, behaviors)
+    median_bout: np.ndarray    # (sessions, behaviors)
+    latency: np.ndarray        # (sessions, behaviors), first onset - t_start
+    bin_edges: np.ndarray      # (bins+1,)
+    bout_count_bin: np.ndarray # (sessions, behaviors, bins)
+
+    @property
+    def bout_rate(self):
+        bin_min = np.diff(self.bin_edges) / 60000
+        return self.bout_count_bin / bin_min
+
+    def to_rows(self):
+        # one dict per session x behavior, e.g. for csv/json export
+        rows = []
+        for s, session in enumerate(self.sessions):
+            for b, name in enumerate(self.behav_names):
+                rows.append({
+                    "session": session,
+                    "behavior": name,
+                    "total_duration": int(self.total_duration[s, b]),
+                    "bout_count": int(self.bout_count[s, b]),
+                    "mean_bout": float(self.mean_bout[s, b]),
+                    "median_bout": float(self.median_bout[s, b]),
+                    "latency": float(self.latency[s, b]),
+                    "bout_count_bin": self.bout_count_bin[s, b].tolist()
+                })
+        return rows
+
+
+def compute_stats(data: Union[BehavCollector, BehavDataset], bin_ms: int=BIN_MS,
+                  t_start: int=0, t_end: int=None):
+    """
+    Ethogram statistics of every session x behavior, without loops over bouts.
+    Bouts are grouped with a single sort by (session, behavior, duration) and reduced per group.
+    t_start, t_end: time range of the bins (t_end defaults to the last offset)
+    """
+    ds = as_dataset(data)
+    n_session, n_behav = len(ds.sessions), len(ds.behav_names)
+    n_group = n_session * n_behav
+
+    key = ds.session.astype(np.int64) * n_behav + ds.behavior
+    duration = ds.duration
+    order = np.lexsort((duration, key))
+    duration_sorted = duration[order]
+
+    count = np.bincount(key, minlength=n_group)
+    total = np.bincount(key, weights=duration, minlength=n_group)
+    has_bout = count > 0
+
+    mean = np.full(n_group, np.nan)
+    mean[has_bout] = total[has_bout] / count[has_bout]
+
+    # median from the sorted durations of each group
+    start = np.concatenate(([0], np.cumsum(count)[:-1]))
+    median = np.full(n_group, np.nan)
+    s, c = start[has_bout], count[has_bout]
+    median[has_bout] = (duration_sorted[s + (c-1)//2] + duration_sorted[s + c//2]) / 2
+
+    latency = np.full(n_group, np.nan)
+    if len(s) > 0:
+        latency[has_bout] = np.minimum.reduceat(ds.onset[order], s) - t_start
+
+    # onset counts per bin
+    if t_end is None:
+        t_end = int(ds.offset.max()) + 1 if len(ds) > 0 else t_start + bin_ms
+    n_bin = max(int(np.ceil((t_end - t_start) / bin_ms)), 1)
+    bin_edges = np.minimum(t_start + bin_ms * np.arange(n_bin + 1, dtype=np.int64), t_end)
+    bin_id = (ds.onset - t_start) // bin_ms
+    in_range = (ds.onset >= t_start) & (ds.onset < t_end)
+    count_bin = np.bincount(key[in_range] * n_bin + bin_id[in_range], minlength=n_group * n_bin)
+
+    shape = (n_session, n_behav)
+    return EthogramStats(
+        sessions=ds.sessions,
+        behav_names=ds.behav_names,
+        total_duration=total.astype(np.int64).reshape(shape),
+        bout_count=count.reshape(shape),
+        mean_bout=mean.reshape(shape),
+        median_bout=median.reshape(shape),
+        latency=latency.reshape(shape),
+        bin_edges=bin_edges,
+        bout_count_bin=count_bin.reshape(shape + (n_bin,))
+    )
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+from typing import List
+
+
+MANIFEST_FILE = "export_manifest.json"
+MANIFEST_VERSION = 1
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def file_checksum(file_name: str, chunk_size: int=1 << 20):
+    h = hashlib.sha1()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def part_name(file_name: str):
+    # outputs are written under this name and renamed when complete,
+    # so that an interrupted export never leaves a file looking finished
+    root, ext = os.path.splitext(file_name)
+    return f"{root}.part{ext}"
+
+
+class ExportManifest:
+    """
+    Record of every clip/snapshot planned in an export directory (export_manifest.json).
+    items: file name (in path_dir) -> {behav_name, type, start_ms, end_ms, vid, status, size, checksum, error}
+    settings: how the items are written (JSON-compatible), the items written with other settings are not reused
+    """
+    def __init__(self, path_dir: str, settings: dict=None):
+        self.path_dir = path_dir
+        self.settings = settings
+        self.items = {}
+        self.stale = False # the directory holds an export made with other settings
+
+    @property
+    def file_name(self):
+        return os.path.join(self.path_dir, MANIFEST_FILE)
+
+    @classmethod
+    def load(cls, path_dir: str, settings: dict=None):
+        # an empty manifest when there is none (or it cannot be read, or has other settings)
+        manifest = cls(path_dir, settings)
+        if os.path.exists(manifest.file_name):
+            try:
+                with open(manifest.file_name, "r") as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION and data.get("settings") == settings:
+                    manifest.items = data["items"]
+                else:
+                    manifest.stale = True
+            except (OSError, ValueError, KeyError):
+                pass
+        return manifest
+
+    def save(self):
+        tmp_name = self.file_name + ".tmp"
+        with open(tmp_name, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings, "items": self.items}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, self.file_name)
+
+    def is_done(self, item, vid: int):
+        # extracted before from the same epoch, and the file is still there unchanged
+        record = self.items.get(os.path.basename(item.file_name(vid)))
+        if record is None or record["status"] != DONE:
+            return False
+        if (record["type"], record["start_ms"], record["end_ms"]) != (item.type, int(item.start_ms), int(item.end_ms)):
+            return False
+        file_name = os.path.join(self.path_dir, os.path.basename(item.file_name(vid)))
+        return os.path.exists(file_name) and os.path.getsize(file_name) == record["size"]
+
+    def plan(self, item, vid: int):
+        self.items[os.path.basename(item.file_name(vid))] = {
+            "behav_name": item.behav_name,
+            "type": item.type,
+            "start_ms": int(item.start_ms),
+            "end_ms": int(item.end_ms),
+            "vid": vid,
+            "status": PENDING,
+            "size": None,
+            "checksum": None,
+            "error": None
+        }
+
+    def prune(self, file_names: List[str]):
+        # keep only the records of file_names (the current plan): the epochs deleted since an earlier export,
+        # or kept by skip_existing, are not reported again
+        keep = set(os.path.basename(f) for f in file_names)
+        self.items = {f: r for f, r in self.items.items() if f in keep}
+
+    def finish(self, file_name: str, size: int=None, checksum: str=None, error: str=None):
+        record = self.items[os.path.basename(file_name)]
+        record["status"] = FAILED if error is not None else DONE
+        record["size"] = size
+        record["checksum"] = checksum
+        record["error"] = error
+
+    def fail_pending(self, file_names: List[str], error: str):
+        # items of a video (chunk) that stopped before reaching them
+        for f in file_names:
+            record = self.items[os.path.basename(f)]
+            if record["status"] == PENDING:
+                record["status"] = FAILED
+                record["error"] = error
+
+    def failures(self):
+        # file name -> error, of the items not extracted
+        return {f: r["error"] or "not extracted" for f, r in self.items.items() if r["status"] != DONE}
+
+    def summary(self):
+        failures = self.failures()
+        return {
+            "total": len(self.items),
+            "done": len(self.items) - len(failures),
+            "failed": failures
+        }
@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, Tuple, Union
+
+
+FPS_WRITE = 10
+FPS_SOURCE = "source" # output fps of the source (divided by the decimation)
+
+
+@dataclass
+class ExportProfile:
+    """
+    How the clips and snapshots are written. Cropping and scaling are applied before encoding.
+    scale: resize factor of the (cropped) frames
+    roi: per video id, the crop (x, y, width, height) in source pixels
+    fps: output fps, or FPS_SOURCE to play the clips in real time
+    decimate: keep one frame out of decimate
+    codec: fourcc of the clips
+    """
+    scale: float = 1.
+    roi: Dict[Union[int, str], Tuple[int, int, int, int]] = field(default_factory=dict)
+    fps: Union[float, str] = FPS_WRITE
+    decimate: int = 1
+    codec: str = "XVID"
+
+    def output_fps(self, source_fps: float):
+        if self.fps == FPS_SOURCE:
+            return source_fps / self.decimate if source_fps > 0 else FPS_WRITE
+        return self.fps
+
+    def _crop_box(self, vid, frame_size):
+        w, h = frame_size
+        if vid not in self.roi:
+            return 0, 0, w, h
+        x, y, rw, rh = self.roi[vid]
+        x, y = min(max(int(x), 0), w - 1), min(max(int(y), 0), h - 1)
+        return x, y, max(min(int(rw), w - x), 1), max(min(int(rh), h - y), 1)
+
+    def output_size(self, vid, frame_size):
+        _, _, w, h = self._crop_box(vid, frame_size)
+        return max(int(round(w * self.scale)), 1), max(int(round(h * self.scale)), 1)
+
+    def apply(self, vid, frame: np.ndarray):
+        # cropped and scaled frame (a new array unless the profile keeps the frame as it is)
+        h, w = frame.shape[:2]
+        x, y, cw, ch = self._crop_box(vid, (w, h))
+        if (x, y, cw, ch) != (0, 0, w, h):
+            frame = frame[y:y+ch, x:x+cw]
+        size = self.output_size(vid, (w, h))
+        if size != (cw, ch):
+            interpolation = cv2.INTER_AREA if self.scale < 1 else cv2.INTER_LINEAR
+            return cv2.resize(frame, size, interpolation=interpolation)
+        return np.ascontiguousarray(frame)
@@ -0,0 +1,74 @@
+import json
+import os
+from dataclasses import asdict, dataclass, field, fields
+
+
+REPORT_FILE = "export_report.json"
+
+
+@dataclass
+class StageCounter:
+    # frames processed by one pipeline stage and the time spent processing them
+    frames: int = 0
+    seconds: float = 0.
+
+    def add(self, seconds: float, frames: int=1):
+        self.frames += frames
+        self.seconds += seconds
+
+    @property
+    def fps(self):
+        return self.frames / self.seconds if self.seconds > 0 else 0.
+
+
+@dataclass
+class ExportStats:
+    """
+    Counters of an export, to see which stage limits the throughput.
+    seek: time of the seeks, and the frames decoded to land on the target frames (seeks: number of seeks)
+    decode: frames read from the videos and the read time (discarded: read, but outside every export window)
+    encode: frames written (crop, resize, overlays and encoding) and the write time
+    outputs, bytes_written: clips/snapshots written and their size
+    The times of the worker processes are summed, so in a parallel export they can exceed wall_seconds.
+    """
+    seeks: int = 0
+    seek: StageCounter = field(default_factory=StageCounter)
+    decode: StageCounter = field(default_factory=StageCounter)
+    discarded: int = 0
+    encode: StageCounter = field(default_factory=StageCounter)
+    outputs: int = 0
+    bytes_written: int = 0
+    wall_seconds: float = 0.
+
+    def merge(self, other: "ExportStats"):
+        # add the counters of a worker (the wall time is kept)
+        for f in fields(self):
+            if f.name == "wall_seconds":
+                continue
+            value = getattr(other, f.name)
+            if isinstance(value, StageCounter):
+                getattr(self, f.name).add(value.seconds, value.frames)
+            else:
+                setattr(self, f.name, getattr(self, f.name) + value)
+        return self
+
+    def report(self):
+        report = asdict(self)
+        for name in ("decode", "encode"):
+            report[name]["fps"] = getattr(self, name).fps
+        report["output_fps"] = self.encode.frames / self.wall_seconds if self.wall_seconds > 0 else 0.
+        return report
+
+    def summary(self):
+        # one line for the progress dialogs
+        return (
+            f"decode {self.decode.fps:.0f} fps, encode {self.encode.fps:.0f} fps, "
+            f"{self.seeks} seeks ({self.seek.seconds:.1f} s), {self.discarded} frames discarded, "
+            f"{self.bytes_written / 1e6:.1f} MB written"
+        )
+
+    def save(self, file_name: str):
+        tmp_name = file_name + ".tmp"
+        with open(tmp_name, "w") as f:
+            json.dump(self.report(), f, indent=1)
+        os.replace(tmp_name, file_name)
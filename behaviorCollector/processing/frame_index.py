@@ -0,0 +1,161 @@
+import cv2
+import hashlib
+import numpy as np
+import os
+
+
+INDEX_DIR = os.path.join(os.path.expanduser("~"), ".behaviorCollector", "frame_index")
+INDEX_VERSION = 1
+SEEK_RETRY = 3 # earlier keyframes (or times) tried before decoding from the start
+SEEK_BACKOFF_FRAMES = 8 # seeks by time: frames aimed before the target, doubled after every miss
+EPS_MS = 1e-3
+
+
+class FrameIndex:
+    """
+    Presentation time (ms) of every frame and the frame numbers of the keyframes of one video.
+    Times are taken from the container, so variable frame rate videos are handled exactly.
+    Built from the packets only (no decoding) and cached on disk, see load_frame_index.
+    """
+    def __init__(self, pts_ms: np.ndarray, keyframes: np.ndarray):
+        self.pts_ms = np.asarray(pts_ms, dtype=np.float64)      # sorted
+        self.keyframes = np.asarray(keyframes, dtype=np.int64)  # sorted frame numbers
+        if len(self.keyframes) == 0 or self.keyframes[0] != 0:
+            self.keyframes = np.concatenate(([0], self.keyframes)).astype(np.int64)
+
+    @classmethod
+    def build(cls, video_path: str):
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+        if not cap.isOpened():
+            raise ValueError(f"Video {video_path} cannot be opened")
+        if not cap.set(cv2.CAP_PROP_FORMAT, -1): # raw packets, no decoding
+            cap.release()
+            raise ValueError(f"Cannot read the packets of {video_path}")
+
+        pts, is_key = [], []
+        while cap.grab():
+            pts.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+            is_key.append(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) > 0)
+        cap.release()
+        if len(pts) == 0:
+            raise ValueError(f"No frames in {video_path}")
+
+        # packets are in decoding order: frame numbers follow the presentation order
+        order = np.argsort(np.array(pts), kind="stable")
+        return cls(np.array(pts)[order], np.flatnonzero(np.array(is_key)[order]))
+
+    def __len__(self):
+        return len(self.pts_ms)
+
+    @property
+    def duration_ms(self):
+        # end of the last frame
+        interval = np.median(np.diff(self.pts_ms)) if len(self) > 1 else 0
+        return float(self.pts_ms[-1] + interval)
+
+    def frame_at(self, t_ms: float):
+        # the frame shown at t_ms
+        n = np.searchsorted(self.pts_ms, t_ms + EPS_MS, side="right") - 1
+        return int(np.clip(n, 0, len(self) - 1))
+
+    def frame_after(self, t_ms: float):
+        # the first frame at or after t_ms (len(self) when there is none)
+        return int(np.searchsorted(self.pts_ms, t_ms - EPS_MS, side="left"))
+
+    def time_of(self, frame: int):
+        return float(self.pts_ms[int(np.clip(frame, 0, len(self) - 1))])
+
+    def step(self, t_ms: float, num_frames: int):
+        # time of the frame num_frames away from the frame shown at t_ms
+        return self.time_of(self.frame_at(t_ms) + num_frames)
+
+    def keyframe_before(self, frame: int):
+        n = np.searchsorted(self.keyframes, frame, side="right") - 1
+        return int(self.keyframes[max(n, 0)])
+
+    def seek(self, cap, frame: int):
+        """
+        Position cap so that the next cap.read() returns frame.
+        Decodes from the closest keyframe before it, or when no keyframe before it can be used (none indexed,
+        or the seeks to them overshoot), from a seek by time a few frames before it, so that the decoder
+        finds its own keyframe; returns the number of frames decoded.
+        """
+        frame = int(np.clip(frame, 0, len(self)))
+        if frame == 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return 0
+
+        last = frame - 1 # the last frame to consume
+        landed = -1
+        key = self.keyframe_before(last)
+        for _ in range(SEEK_RETRY):
+            if key == 0:
+                break
+            landed = self._seek_time(cap, self.pts_ms[key], last)
+            if landed >= 0:
+                break
+            key = self.keyframe_before(key - 1)
+        backoff = SEEK_BACKOFF_FRAMES
+        for _ in range(SEEK_RETRY):
+            if landed >= 0 or last - backoff <= 0: # close to the start, decoded from it
+                break
+            landed = self._seek_time(cap, self.pts_ms[last - backoff], last)
+            backoff *= 2
+        if landed < 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+        for _ in range(last - landed):
+            if not cap.grab():
+                break
+        return last - landed
+
+    def _seek_time(self, cap, t_ms: float, last: int):
+        # frame consumed by a seek to t_ms, -1 when it is after last
+        cap.set(cv2.CAP_PROP_POS_MSEC, t_ms)
+        if cap.grab():
+            landed = self._nearest(cap.get(cv2.CAP_PROP_POS_MSEC))
+            if landed <= last:
+                return landed
+        return -1
+
+    def _nearest(self, t_ms: float):
+        n = int(np.clip(np.searchsorted(self.pts_ms, t_ms), 1, len(self) - 1)) if len(self) > 1 else 0
+        if n > 0 and t_ms - self.pts_ms[n-1] <= self.pts_ms[n] - t_ms:
+            n -= 1
+        return n
+
+
+def _cache_file(video_path: str, cache_dir: str):
+    # keyed by path, size and modification time: a modified video gets a new index
+    st = os.stat(video_path)
+    key = f"{os.path.abspath(video_path)}|{st.st_size}|{st.st_mtime_ns}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+
+def find_frame_index(video_path: str, cache_dir: str=INDEX_DIR):
+    # FrameIndex of the video when it is in the cache, otherwise None (nothing is read from the video)
+    file_name = _cache_file(video_path, cache_dir)
+    if os.path.exists(file_name):
+        try:
+            with np.load(file_name) as data:
+                if int(data["version"]) == INDEX_VERSION:
+                    return FrameIndex(data["pts_ms"], data["keyframes"])
+        except Exception:
+            pass # rebuilt by load_frame_index
+    return None
+
+
+def load_frame_index(video_path: str, cache_dir: str=INDEX_DIR):
+    # FrameIndex of the video, from the cache when it is there
+    index = find_frame_index(video_path, cache_dir)
+    if index is not None:
+        return index
+
+    file_name = _cache_file(video_path, cache_dir)
+    index = FrameIndex.build(video_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_name = f"{file_name}.{os.getpid()}.tmp"
+    with open(tmp_name, "wb") as f:
+        np.savez(f, version=INDEX_VERSION, pts_ms=index.pts_ms, keyframes=index.keyframes)
+    os.replace(tmp_name, file_name)
+    return index
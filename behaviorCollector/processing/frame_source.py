@@ -0,0 +1,180 @@
+import cv2
+import threading
+import numpy as np
+from collections import OrderedDict
+from .frame_index import FrameIndex
+
+
+CACHE_MB = 256        # decoded frames kept per video
+PREFETCH_FRAMES = 30  # frames decoded ahead of and behind the cursor
+
+
+class FrameSource:
+    """
+    Decoded frames of a video for frame stepping, without going through the media player.
+    Frames are kept in an LRU cache bounded to cache_mb, and a background thread decodes the
+    prefetch frames after and before the last frame asked (the cursor), so that stepping around it
+    is served from memory. The frames returned are shared with the cache: do not modify them.
+    frame_index: exact frame times (see FrameIndex), otherwise the frames are numbered at the constant fps
+    cap: capture to decode the frames from instead of video_path (e.g., a ProxyCapture)
+    on_ready: on_ready(frame) is called from the prefetch thread when a frame asked with get(wait=False) is cached
+    """
+    def __init__(self, video_path: str, frame_index: FrameIndex=None, cache_mb: float=CACHE_MB,
+                 prefetch: int=PREFETCH_FRAMES, cap=None, on_ready=None):
+        self.cap = cap if cap is not None else cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise ValueError(f"Video capture cannot be opened: {video_path}")
+        self.frame_index = frame_index
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps > 1e-3 else 0
+        if frame_index is not None:
+            self.num_frames = len(frame_index)
+        else:
+            self.num_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.cache_bytes = int(cache_mb * 2**20)
+        self.prefetch = prefetch
+        self.on_ready = on_ready
+        self.hits, self.misses = 0, 0
+
+        self._cache = OrderedDict() # frame number -> frame, least recently used first
+        self._cached_bytes = 0
+        self._frame_bytes = None
+        self._cache_lock = threading.Lock()
+        self._cap_lock = threading.Lock() # the capture is used by the caller and the prefetch thread
+        self._next_frame = 0              # frame returned by the next read of the capture
+        self._cursor = 0
+        self._requested = None            # frame asked with get(wait=False), decoded first
+        self._wake = threading.Event()    # set when the cursor moves
+        self._stop = False
+        self._thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+        self._thread.start()
+
+    def frame_number(self, position_ms: float):
+        # frame shown at position_ms
+        if self.frame_index is not None:
+            return self.frame_index.frame_at(position_ms)
+        frame = int(position_ms / 1000 * self.fps) if self.fps > 0 else 0
+        return int(np.clip(frame, 0, max(self.num_frames - 1, 0)))
+
+    def get(self, frame: int, wait: bool=True):
+        # the frame (None when it cannot be decoded), which becomes the cursor of the prefetch
+        # wait=False: a frame that is not cached is decoded by the prefetch thread instead, before the
+        # other frames, and None is returned (see on_ready), so that the caller never waits for a seek
+        frame = int(np.clip(frame, 0, max(self.num_frames - 1, 0)))
+        with self._cache_lock:
+            image = self._cache.get(frame)
+            if image is not None:
+                self._cache.move_to_end(frame)
+                self.hits += 1
+            else:
+                self.misses += 1
+                if not wait:
+                    self._requested = frame
+        if image is None and wait:
+            image = self._decode(frame)
+        self._cursor = frame
+        self._wake.set()
+        return image
+
+    def get_at(self, position_ms: float):
+        return self.get(self.frame_number(position_ms))
+
+    def peek(self, frame: int):
+        # the frame when it is in the cache, otherwise None (nothing is decoded and the cursor stays)
+        with self._cache_lock:
+            image = self._cache.get(int(frame))
+            if image is not None:
+                self._cache.move_to_end(int(frame))
+        return image
+
+    def set_frame_index(self, frame_index: FrameIndex):
+        # exact frame times once they are known (e.g., indexed in the background); the frames decoded
+        # until then are numbered in decoding order as well, so the cache is kept
+        with self._cap_lock:
+            self.frame_index = frame_index
+            self.num_frames = len(frame_index)
+    
+    def release(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join(timeout=1)
+        with self._cap_lock:
+            self.cap.release()
+        with self._cache_lock:
+            self._cache.clear()
+            self._cached_bytes = 0
+
+    def _decode(self, frame: int):
+        with self._cap_lock:
+            with self._cache_lock:
+                if frame in self._cache: # decoded by the other thread in the meantime
+                    return self._cache[frame]
+            if self._next_frame != frame:
+                if self.frame_index is not None:
+                    self.frame_index.seek(self.cap, frame)
+                else:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+            ret, image = self.cap.read()
+            if not ret:
+                self._next_frame = None
+                return None
+            self._next_frame = frame + 1
+        self._put(frame, image)
+        return image
+
+    def _put(self, frame: int, image: np.ndarray):
+        with self._cache_lock:
+            if frame in self._cache:
+                return
+            self._cache[frame] = image
+            self._cached_bytes += image.nbytes
+            self._frame_bytes = image.nbytes
+            while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+                _, old = self._cache.popitem(last=False)
+                self._cached_bytes -= old.nbytes
+
+    def _radius(self):
+        # frames prefetched on each side, so that the window never evicts itself from the cache
+        if self._frame_bytes is None:
+            return 0
+        return int(min(self.prefetch, max(self.cache_bytes // self._frame_bytes // 2 - 1, 0)))
+
+    def _missing_runs(self, cursor: int):
+        # runs [start, end] of the frames of the window around cursor that are not cached,
+        # the closest to the cursor first (the window frames in the cache are marked as recently used)
+        radius = self._radius()
+        lo, hi = max(cursor - radius, 0), min(cursor + radius, self.num_frames - 1)
+        runs, start = [], None
+        with self._cache_lock:
+            for frame in range(lo, hi + 1):
+                if frame in self._cache:
+                    self._cache.move_to_end(frame)
+                    if start is not None:
+                        runs.append((start, frame - 1))
+                        start = None
+                elif start is None:
+                    start = frame
+        if start is not None:
+            runs.append((start, hi))
+        # a run before the cursor is decoded from its start, so its distance is the one of its end
+        return sorted(runs, key=lambda run: run[0] - cursor if run[0] > cursor else cursor - run[1])
+
+    def _prefetch_loop(self):
+        while True:
+            self._wake.wait()
+            if self._stop:
+                return
+            self._wake.clear()
+            with self._cache_lock:
+                requested, self._requested = self._requested, None
+            if requested is not None and self._decode(requested) is not None and self.on_ready is not None:
+                self.on_ready(requested)
+            for start, end in self._missing_runs(self._cursor):
+                frame = start
+                # stop when the cursor moves, and plan again around the new one
+                while frame <= end and not self._wake.is_set():
+                    if self._decode(frame) is None:
+                        break
+                    frame += 1
+                if self._wake.is_set():
+                    break
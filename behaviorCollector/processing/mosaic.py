@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import List
+
+
+MOSAIC = "mosaic" # video id of the mosaic outputs: f"{prefix}(mosaic).avi/.jpg"
+
+
+@dataclass
+class MosaicLayout:
+    # grid of the cameras (rows x cols, filled row by row) and the downscale of every tile
+    rows: int = None
+    cols: int = None
+    tile_scale: float = 0.5
+
+    def grid(self, num_videos: int):
+        rows, cols = self.rows, self.cols
+        if rows is None and cols is None:
+            cols = int(np.ceil(np.sqrt(num_videos)))
+        if cols is None:
+            cols = int(np.ceil(num_videos / rows))
+        if rows is None:
+            rows = int(np.ceil(num_videos / cols))
+        if rows * cols < num_videos:
+            raise ValueError(f"A {rows}x{cols} mosaic cannot hold {num_videos} videos")
+        return rows, cols
+
+
+class MosaicCapture:
+    """
+    All the videos decoded in lockstep and tiled into one frame, with the cv2.VideoCapture calls
+    used by the extractor (read, get, set, isOpened, release).
+    The first video is the time base: each read returns its next frame, and the other videos show
+    their latest frame at or before that time (black before their first frame).
+    """
+    def __init__(self, video_path: List[str], layout: MosaicLayout, frame_index: list=None, roi: dict=None):
+        self.caps = [cv2.VideoCapture(path) for path in video_path]
+        self.frame_index = frame_index if frame_index is not None else [None] * len(video_path)
+        self.roi = roi if roi is not None else {} # per video id, crop (x, y, width, height) of its tile
+        self.rows, self.cols = layout.grid(len(video_path))
+
+        w = int(self.caps[0].get(cv2.CAP_PROP_FRAME_WIDTH) * layout.tile_scale)
+        h = int(self.caps[0].get(cv2.CAP_PROP_FRAME_HEIGHT) * layout.tile_scale)
+        self.tile_size = (max(w, 1), max(h, 1))
+        self.current = [None] * len(self.caps)   # frame shown by every video
+        self.lookahead = [None] * len(self.caps) # (frame, time) read ahead for the videos > 0
+        self.current_ms = 0.
+
+    def isOpened(self):
+        return all(cap.isOpened() for cap in self.caps)
+
+    def release(self):
+        for cap in self.caps:
+            cap.release()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.current_ms
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.tile_size[0] * self.cols
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.tile_size[1] * self.rows
+        return self.caps[0].get(prop)
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_MSEC:
+            raise ValueError("Only CAP_PROP_POS_MSEC can be set for a mosaic")
+        # the first video at the first frame from value, the others at the frame they show at value
+        for n, (cap, index) in enumerate(zip(self.caps, self.frame_index)):
+            if index is None:
+                cap.set(cv2.CAP_PROP_POS_MSEC, value)
+            else:
+                index.seek(cap, index.frame_after(value) if n == 0 else index.frame_at(value))
+            self.current[n] = None
+            self.lookahead[n] = None
+        return True
+
+    def _read_ahead(self, n: int):
+        ret, frame = self.caps[n].read()
+        self.lookahead[n] = (frame, self.caps[n].get(cv2.CAP_PROP_POS_MSEC)) if ret else False
+
+    def read(self):
+        ret, frame = self.caps[0].read()
+        if not ret:
+            return False, None
+        self.current_ms = self.caps[0].get(cv2.CAP_PROP_POS_MSEC)
+        self.current[0] = frame
+
+        for n in range(1, len(self.caps)):
+            if self.lookahead[n] is None:
+                self._read_ahead(n)
+            while self.lookahead[n] and self.lookahead[n][1] <= self.current_ms:
+                self.current[n] = self.lookahead[n][0]
+                self._read_ahead(n)
+        return True, self._tile()
+
+    def _fit(self, n: int, frame):
+        # frame (cropped and) resized into a tile, keeping its aspect ratio
+        tw, th = self.tile_size
+        tile = np.zeros((th, tw, 3), dtype=np.uint8)
+        if frame is None:
+            return tile
+        if n in self.roi:
+            x, y, w, h = self.roi[n]
+            frame = frame[max(y, 0):y+h, max(x, 0):x+w]
+        h, w = frame.shape[:2]
+        scale = min(tw / w, th / h)
+        nw, nh = max(int(w * scale), 1), max(int(h * scale), 1)
+        x0, y0 = (tw - nw) // 2, (th - nh) // 2
+        tile[y0:y0+nh, x0:x0+nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_AREA)
+        return tile
+
+    def _tile(self):
+        tw, th = self.tile_size
+        mosaic = np.zeros((th * self.rows, tw * self.cols, 3), dtype=np.uint8)
+        for n, frame in enumerate(self.current):
+            r, c = divmod(n, self.cols)
+            mosaic[r*th:(r+1)*th, c*tw:(c+1)*tw] = self._fit(n, frame)
+        return mosaic
@@ -0,0 +1,151 @@
+import cv2
+import hashlib
+import numpy as np
+import os
+
+
+PROXY_DIR = os.path.join(os.path.expanduser("~"), ".behaviorCollector", "proxy")
+PROXY_VERSION = 1
+PROXY_HEIGHT = 360
+PROXY_QUALITY = 80   # JPEG quality of the proxy frames
+KEY_BYTES = 1 << 20  # bytes read from the start and the end of the video for its content key
+
+
+def proxy_key(video_path: str, height: int=PROXY_HEIGHT):
+    # keyed by the content (size, first and last MB), so a copied or moved video keeps its proxy
+    size = os.path.getsize(video_path)
+    h = hashlib.sha1(f"{PROXY_VERSION}|{height}|{size}".encode())
+    with open(video_path, "rb") as f:
+        h.update(f.read(KEY_BYTES))
+        f.seek(max(size - KEY_BYTES, 0))
+        h.update(f.read(KEY_BYTES))
+    return h.hexdigest()
+
+
+def proxy_file(video_path: str, cache_dir: str=PROXY_DIR, height: int=PROXY_HEIGHT):
+    # the frames (.mjpg) and their index (.npz) share this name
+    return os.path.join(cache_dir, proxy_key(video_path, height) + ".mjpg")
+
+
+def _index_file(file_name: str):
+    return os.path.splitext(file_name)[0] + ".npz"
+
+
+def find_proxy(video_path: str, cache_dir: str=PROXY_DIR, height: int=PROXY_HEIGHT):
+    # the proxy of the video when it was built before, otherwise None
+    file_name = proxy_file(video_path, cache_dir, height)
+    return file_name if os.path.exists(_index_file(file_name)) else None
+
+
+def build_proxy(video_path: str, cache_dir: str=PROXY_DIR, height: int=PROXY_HEIGHT):
+    """
+    Low resolution, all-intra copy of the video for scrubbing and stepping (runs in a background process).
+    Every frame is kept, in order, so frame n of the proxy is frame n of the video: the proxy is read
+    by frame number, and the times stay the ones of the original video.
+    The frames are JPEG images one after another (a raw MJPEG stream) with the byte offset of every frame
+    in the index, see ProxyCapture. Returns the proxy file, taken from the cache when it is there.
+    """
+    file_name = proxy_file(video_path, cache_dir, height)
+    if os.path.exists(_index_file(file_name)):
+        return file_name
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Video {video_path} cannot be opened")
+    w, h = cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    scale = min(height / h, 1.) if h > 0 else 1.
+    size = (max(int(round(w * scale)), 1), max(int(round(h * scale)), 1))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_name = f"{file_name}.{os.getpid()}.tmp"
+    offsets = [0]
+    try:
+        with open(tmp_name, "wb") as f:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if (frame.shape[1], frame.shape[0]) != size:
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                _, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, PROXY_QUALITY])
+                f.write(data.tobytes())
+                offsets.append(offsets[-1] + len(data))
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+    finally:
+        cap.release()
+    if len(offsets) == 1:
+        os.remove(tmp_name)
+        raise ValueError(f"No frames in {video_path}")
+
+    # the index is written last: a proxy is complete when its index exists
+    os.replace(tmp_name, file_name)
+    tmp_name = f"{_index_file(file_name)}.{os.getpid()}.tmp"
+    with open(tmp_name, "wb") as f:
+        np.savez(f, version=PROXY_VERSION, offsets=np.array(offsets, dtype=np.int64),
+                 fps=fps, width=size[0], height=size[1])
+    os.replace(tmp_name, _index_file(file_name))
+    return file_name
+
+
+class ProxyCapture:
+    """
+    Reader of a proxy (see build_proxy), with the cv2.VideoCapture calls used by FrameSource
+    (read, get, set, isOpened, release). A frame is read with one file read and one JPEG decode,
+    so seeks cost nothing.
+    """
+    def __init__(self, file_name: str):
+        with np.load(_index_file(file_name)) as data:
+            if int(data["version"]) != PROXY_VERSION:
+                raise ValueError(f"Proxy {file_name} has another version")
+            self.offsets = data["offsets"]
+            self.fps = float(data["fps"])
+            self.size = (int(data["width"]), int(data["height"]))
+        self.file = open(file_name, "rb")
+        self.pos = 0 # frame returned by the next read
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def isOpened(self):
+        return self.file is not None
+
+    def release(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.pos
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self)
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.size[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.size[1]
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.pos / self.fps * 1000 if self.fps > 0 else 0.
+        return 0.
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            raise ValueError("Only CAP_PROP_POS_FRAMES can be set for a proxy")
+        self.pos = int(np.clip(value, 0, len(self)))
+        return True
+
+    def read(self):
+        if self.file is None or self.pos >= len(self):
+            return False, None
+        self.file.seek(self.offsets[self.pos])
+        data = self.file.read(self.offsets[self.pos + 1] - self.offsets[self.pos])
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        self.pos += 1
+        return frame is not None, frame
+
+    def grab(self):
+        return self.read()[0]
@@ -0,0 +1,92 @@
+import cv2
+import io
+import numpy as np
+import os
+import tarfile
+import zipfile
+
+
+ARCHIVE_EXT = (".zip", ".tar")
+SHEET_COLS = 8
+SHEET_ROWS = 6
+THUMB_SCALE = 0.25
+
+
+class SnapshotArchive:
+    """
+    Images written into a .zip (stored, JPEGs are not compressed again) or a .tar archive.
+    chunk_size: start a new part (name.000.zip, name.001.zip, ...) every chunk_size images
+    """
+    def __init__(self, file_name: str, chunk_size: int=None):
+        root, ext = os.path.splitext(file_name)
+        if ext not in ARCHIVE_EXT:
+            raise ValueError(f"Unsupported archive {file_name}, use one of {ARCHIVE_EXT}")
+        self.root, self.ext = root, ext
+        self.chunk_size = chunk_size
+        self.num = 0
+        self.parts = []
+        self._archive = None
+
+    def _open_part(self):
+        self.close()
+        if self.chunk_size is None:
+            file_name = self.root + self.ext
+        else:
+            file_name = f"{self.root}.{len(self.parts):03d}{self.ext}"
+        if self.ext == ".zip":
+            self._archive = zipfile.ZipFile(file_name, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._archive = tarfile.open(file_name, "w")
+        self.parts.append(file_name)
+
+    def add(self, name: str, data: bytes):
+        # returns the archive (part) file holding the image
+        if self._archive is None or (self.chunk_size is not None and self.num % self.chunk_size == 0):
+            self._open_part()
+        if self.ext == ".zip":
+            self._archive.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            self._archive.addfile(info, io.BytesIO(data))
+        self.num += 1
+        return self.parts[-1]
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+
+class ContactSheet:
+    # thumbnails tiled into pages of cols x rows, written as f"{prefix}_{page:03d}.jpg" when a page is full
+    def __init__(self, prefix: str, cols: int=SHEET_COLS, rows: int=SHEET_ROWS, thumb_scale: float=THUMB_SCALE):
+        self.prefix = prefix
+        self.cols, self.rows = cols, rows
+        self.thumb_scale = thumb_scale
+        self.thumbs = []
+        self.pages = []
+
+    def add(self, frame: np.ndarray, label: str):
+        h, w = frame.shape[:2]
+        size = (max(int(w * self.thumb_scale), 1), max(int(h * self.thumb_scale), 1))
+        thumb = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        cv2.putText(thumb, label, (2, size[1] - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.35, (0, 255, 255), 1, cv2.LINE_AA)
+        self.thumbs.append(thumb)
+        if len(self.thumbs) == self.cols * self.rows:
+            self.flush()
+
+    def flush(self):
+        if len(self.thumbs) == 0:
+            return
+        th = max(t.shape[0] for t in self.thumbs)
+        tw = max(t.shape[1] for t in self.thumbs)
+        rows = int(np.ceil(len(self.thumbs) / self.cols))
+        sheet = np.zeros((th * rows, tw * self.cols, 3), dtype=np.uint8)
+        for n, thumb in enumerate(self.thumbs):
+            r, c = divmod(n, self.cols)
+            sheet[r*th:r*th+thumb.shape[0], c*tw:c*tw+thumb.shape[1]] = thumb
+        file_name = f"{self.prefix}_{len(self.pages):03d}.jpg"
+        cv2.imwrite(file_name, sheet)
+        self.pages.append(file_name)
+        self.thumbs = []
@@ -0,0 +1,197 @@
+import numpy as np
+from typing import List, Union
+
+
+INIT_CAPACITY = 64
+EVENT_SPAN_MS = 1 # events are matched as [t, t+1], same as the timeline items
+_BUFFERS = ("_onset", "_offset", "_max_offset", "_n")
+
+
+class TimeArray:
+    """
+    Sorted int64 storage of behavior times.
+    States keep (onset, offset) pairs and events keep single time points (offset == onset).
+    A running maximum of the offsets is kept along the onsets, so point and range
+    lookups only need two binary searches over the sorted arrays.
+    """
+    def __init__(self, is_event: bool, capacity: int=INIT_CAPACITY):
+        self.is_event = is_event
+        capacity = max(int(capacity), 1)
+        self._onset = np.empty(capacity, dtype=np.int64)
+        self._offset = np.empty(capacity, dtype=np.int64)
+        self._max_offset = np.empty(capacity, dtype=np.int64)
+        self._n = 0
+
+    @staticmethod
+    def lazy(loader, is_event: bool):
+        # loader() -> (onset, offset) is called on the first access to the times
+        ta = TimeArray.__new__(TimeArray)
+        ta.is_event = is_event
+        ta._loader = loader
+        return ta
+
+    def __getattr__(self, name):
+        # only reached for missing attributes, i.e. the buffers of a lazy TimeArray not loaded yet
+        loader = self.__dict__.get("_loader")
+        if loader is None or name not in _BUFFERS:
+            raise AttributeError(name)
+        onset, offset = loader()
+        loaded = TimeArray.from_arrays(onset, offset, self.is_event)
+        del self._loader
+        self.__dict__.update({key: loaded.__dict__[key] for key in _BUFFERS})
+        return getattr(self, name)
+
+    @property
+    def is_loaded(self):
+        return "_loader" not in self.__dict__
+
+    @staticmethod
+    def from_list(time_ms: List, is_event: bool):
+        time_ms = [] if time_ms is None else time_ms
+        arr = np.asarray(time_ms, dtype=np.int64)
+        if is_event:
+            arr = arr.reshape(-1)
+            onset, offset = arr, arr
+        else:
+            arr = arr.reshape(-1, 2)
+            onset, offset = arr.min(axis=1), arr.max(axis=1)
+        return TimeArray.from_arrays(onset, offset, is_event)
+
+    @staticmethod
+    def from_arrays(onset: np.ndarray, offset: np.ndarray, is_event: bool):
+        onset = np.asarray(onset, dtype=np.int64).reshape(-1)
+        offset = onset if is_event else np.asarray(offset, dtype=np.int64).reshape(-1)
+        if len(onset) != len(offset):
+            raise ValueError("onset and offset must have the same length")
+
+        order = np.argsort(onset, kind="stable")
+        ta = TimeArray(is_event, capacity=max(INIT_CAPACITY, 2*len(onset)))
+        n = len(onset)
+        ta._onset[:n] = onset[order]
+        ta._offset[:n] = offset[order]
+        ta._n = n
+        ta._update_max_offset(0)
+        return ta
+
+    def _reserve(self, size: int):
+        capacity = len(self._onset)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for key in ("_onset", "_offset", "_max_offset"):
+            arr = np.empty(capacity, dtype=np.int64)
+            arr[:self._n] = getattr(self, key)[:self._n]
+            setattr(self, key, arr)
+
+    def _update_max_offset(self, start: int):
+        n = self._n
+        if start >= n:
+            return
+        mx = np.maximum.accumulate(self._offset[start:n])
+        if start > 0:
+            np.maximum(mx, self._max_offset[start-1], out=mx)
+        self._max_offset[start:n] = mx
+
+    def insert(self, onset: int, offset: int=None):
+        onset = int(onset)
+        if self.is_event:
+            offset = onset
+        elif offset is None:
+            raise ValueError("States need both onset and offset")
+        else:
+            offset = int(offset)
+            if offset < onset:
+                onset, offset = offset, onset
+
+        n = self._n
+        self._reserve(n+1)
+        # appending in time order (the usual case while annotating) does not move any data
+        idx = int(np.searchsorted(self._onset[:n], onset, side="right"))
+        if idx < n:
+            self._onset[idx+1:n+1] = self._onset[idx:n]
+            self._offset[idx+1:n+1] = self._offset[idx:n]
+        self._onset[idx] = onset
+        self._offset[idx] = offset
+        self._n += 1
+        self._update_max_offset(idx)
+        return idx
+
+    def remove(self, indices: Union[int, np.ndarray]):
+        indices = np.unique(np.asarray(indices, dtype=np.int64).reshape(-1))
+        if len(indices) == 0:
+            return
+        n = self._n
+        if indices[0] < 0 or indices[-1] >= n:
+            raise IndexError(f"Index out of range (size={n})")
+
+        keep = np.ones(n, dtype=bool)
+        keep[indices] = False
+        m = n - len(indices)
+        self._onset[:m] = self._onset[:n][keep]
+        self._offset[:m] = self._offset[:n][keep]
+        self._n = m
+        self._update_max_offset(int(indices[0]))
+
+    def find(self, time_ms: int):
+        # indices of the items containing time_ms
+        return self.overlapping(time_ms, time_ms)
+
+    def overlapping(self, t0: int, t1: int):
+        # indices of the items overlapping [t0, t1]
+        n = self._n
+        span = EVENT_SPAN_MS if self.is_event else 0
+        lo = int(np.searchsorted(self._max_offset[:n], t0 - span, side="left"))
+        hi = int(np.searchsorted(self._onset[:n], t1, side="right"))
+        if hi <= lo:
+            return np.empty(0, dtype=np.int64)
+        idx = np.flatnonzero(self._offset[lo:hi] + span >= t0)
+        return idx + lo
+
+    def next_index(self, time_ms: int):
+        # index of the first item starting after time_ms (None if there is no such item)
+        idx = int(np.searchsorted(self._onset[:self._n], time_ms, side="right"))
+        return idx if idx < self._n else None
+
+    def previous_index(self, time_ms: int):
+        # index of the last item starting before time_ms (None if there is no such item)
+        idx = int(np.searchsorted(self._onset[:self._n], time_ms, side="left")) - 1
+        return idx if idx >= 0 else None
+
+    @property
+    def onsets(self):
+        view = self._onset[:self._n]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def offsets(self):
+        view = self._offset[:self._n]
+        view.flags.writeable = False
+        return view
+
+    def tolist(self):
+        # JSON compatible view: [[onset, offset], ...] for states, [time, ...] for events
+        if self.is_event:
+            return self._onset[:self._n].tolist()
+        return np.stack((self._onset[:self._n], self._offset[:self._n]), axis=1).tolist()
+
+    def __getitem__(self, n: int):
+        if n < 0:
+            n += self._n
+        if n < 0 or n >= self._n:
+            raise IndexError(f"Index {n} out of range (size={self._n})")
+        if self.is_event:
+            return int(self._onset[n])
+        return [int(self._onset[n]), int(self._offset[n])]
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __len__(self):
+        return self._n
+
+    def __repr__(self):
+        if not self.is_loaded:
+            return f"TimeArray(is_event={self.is_event}, not loaded)"
+        return f"TimeArray(is_event={self.is_event}, n={self._n})"
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from behaviorCollector.processing.behav_algebra import difference, intersection, union
+from behaviorCollector.processing.time_array import TimeArray
+
+
+def _state(*bouts):
+    onset = np.array([b[0] for b in bouts], dtype=np.int64)
+    offset = np.array([b[1] for b in bouts], dtype=np.int64)
+    return TimeArray.from_arrays(onset, offset, is_event=False)
+
+
+def _bouts(time_ms):
+    return list(zip(np.asarray(time_ms.onsets).tolist(), np.asarray(time_ms.offsets).tolist()))
+
+
+@pytest.mark.parametrize("swap", [False, True])
+def test_empty_operand(swap):
+    a, empty = _state((1000, 2000), (3000, 4000)), TimeArray(False)
+    x, y = (empty, a) if swap else (a, empty)
+    assert _bouts(union(x, y)) == [(1000, 2000), (3000, 4000)]
+    assert _bouts(intersection(x, y)) == []
+    assert _bouts(difference(x, y)) == ([] if swap else [(1000, 2000), (3000, 4000)])
+
+
+def test_both_empty():
+    assert _bouts(union(TimeArray(False), TimeArray(False))) == []
+
+
+def test_overlapping_operands():
+    a, b = _state((0, 1000), (2000, 3000)), _state((500, 2500))
+    assert _bouts(union(a, b)) == [(0, 3000)]
+    assert _bouts(intersection(a, b)) == [(500, 1000), (2000, 2500)]
+    assert _bouts(difference(a, b)) == [(0, 500), (2500, 3000)]